@@ -3,6 +3,7 @@ import numpy as np
 import random
 import argparse
 import os
+import sys
 import time
 from keras.models import model_from_json, Model
 from keras.models import Sequential
@@ -18,6 +19,10 @@ from CriticNetwork import CriticNetwork
 from OU import OU
 import timeit
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from memory_watchdog import MemoryWatchdog
+from time_scale import speed_up
+
 OU = OU()       #Ornstein-Uhlenbeck Process
 
 def playGame(train_indicator=0):    #1 means Train, 0 means simply Run
@@ -35,6 +40,7 @@ def playGame(train_indicator=0):    #1 means Train, 0 means simply Run
     np.random.seed(1337)
 
     vision = True
+    time_scale = 1   #simulated seconds per second, a power of two. 4 is what makeitfast.sh did
 
     EXPLORE = 100000.
     episode_count = 20000
@@ -58,6 +64,7 @@ def playGame(train_indicator=0):    #1 means Train, 0 means simply Run
 
     # Generate a Torcs environment
     env = TorcsEnv(vision=vision, throttle=True,gear_change=False)
+    watchdog = MemoryWatchdog(limit_mb=1024)   #relaunches TORCS once it takes 1 GB
     results_folder = "Results"
 
     if not os.path.exists(results_folder):
@@ -82,15 +89,18 @@ def playGame(train_indicator=0):    #1 means Train, 0 means simply Run
 
         print("Episode : " + str(i) + " Replay Buffer " + str(buff.count()))
 
+        relaunch = False
         if np.mod(i, 3) == 0:
-            ob = env.reset(relaunch=True)   #relaunch TORCS every 3 episode because of the memory leak error
+            relaunch = watchdog.check()   #relaunch TORCS because of the memory leak error, if it leaked enough
+            ob = env.reset(relaunch=relaunch)
+            if relaunch:
+                watchdog.relaunched()
         else:
             ob = env.reset()
-        # time.sleep(0.5)
-        # print "#######################################Making it fast"
-        # os.system('sh makeitfast.sh')
-        # print "########################################Did it make fast"
-        # time.sleep(0.5)
+        if time_scale != 1 and (i == 0 or relaunch):
+            #a fresh TORCS runs in real time, pressing again on a running one would double it again
+            time.sleep(0.5)
+            speed_up(time_scale)
 
         s_t = np.hstack((ob.img))
         total_reward = 0.
@@ -170,6 +180,7 @@ def playGame(train_indicator=0):    #1 means Train, 0 means simply Run
         print("Total Step: " + str(step))
         print("")
 
+    print(watchdog.summary())
     env.end()  # This is for shutting down TORCS
     print("Finish.")
 
@@ -1,4 +1,5 @@
 from environment import Environment
+from scripts.process_manager import MemoryWatchdog
 from agent import Agent
 import numpy as np
 
@@ -7,7 +8,9 @@ if __name__ == "__main__":
     max_steps = 50
     buffer_size = 100000
 
-    env = Environment()
+    # Relaunches TORCS only once its memory use passes 1 GB
+    watchdog = MemoryWatchdog(limit_mb=1024)
+    env = Environment(watchdog=watchdog)
     agent = Agent()
 
     for i in range(episode_count):
@@ -18,11 +21,13 @@ if __name__ == "__main__":
 
         print("Episode : " + str(i))
 
-        # Sometimes you need to relaunch TORCS because of the memory leak error
+        # Sometimes you need to relaunch TORCS because of the memory leak error,
+        # the watchdog decides whether it is time
         if np.mod(i, 3) == 0:
             observation = env.reset(relaunch=True)
         else:
             observation = env.reset()
+        print("Reset (%s) took %.3fs" % (env.reset_path, env.reset_seconds))
 
         for j in range(max_steps):
             action = agent.act(observation, reward, done)
@@ -33,9 +38,12 @@ if __name__ == "__main__":
             if done:
                 break
 
+        print("%.0f steps/s, %.1fx real time" % (env.rate.steps_per_second(), env.rate.time_scale()))
+
         print("TOTAL REWARD @ " + str(i) +" -th Episode  :  " + str(total_reward))
         print("Total Step: " + str(step))
         print("")
 
+    print(watchdog.summary())
     env.close_torcs()  # This is for shutting down TORCS
     print("Finish.")
@@ -7,81 +7,245 @@ import numpy as np
 import copy
 import collections as col
 import os
+import queue
+import threading
 import time
+from observation import Observation, ObservationPool, FrameStack
+from step_timers import EpisodeProfiler, RateMeter
 from scripts.autostart import TorcsInstance
 
 
 class Environment:
     default_speed = 10
     initial_reset = True
-
-    def __init__(self, throttle=False, gear_change=False):
+    stepped_at = None
+    client = None
+    reset_path = None  # How the last reset went: connect, soft, swap or relaunch
+    reset_seconds = None
+    profiler = None
+    receiver = None
+    lap = None
+
+    def __init__(self, throttle=False, gear_change=False, timers=None, port=3101, launch=True,
+                 frame_skip=1, frame_stack=0, standby=None,
+                 profile=None, image_pipeline=None, vision=True, background=False,
+                 process=None, watchdog=None, time_scale=None):
         self.throttle = throttle
 
+        # Server ticks every action is repeated for, the agent only sees
+        # the last one and the reward summed over all of them
+        self.frame_skip = frame_skip
+
+        # vision=False is the sensor-only mode: TORCS runs without -vision,
+        # the client never decodes img and observations are the packed
+        # float32 vector of Observation.layout (69 values, see observation.py)
+        self.vision = vision
+
+        # SCR server port. With launch=False TORCS (or the stand-in) is
+        # already up there and is never started, killed or relaunched.
+        self.port = port
+        self.launch = launch
+
+        # Optional scripts.process_manager.TorcsProcess serving on port,
+        # started, stopped and relaunched instead of pkill and TorcsInstance
+        self.process = process
+        if process is not None:
+            self.port = process.port
+            self.launch = True
+            process.vision = vision  # No -vision in sensor-only mode
+
+        # Simulated seconds per wall-clock second TORCS is set to after
+        # every launch, a power of two (Shift+plus key presses, see
+        # scripts.time_scale.speed_up). None leaves the simulator alone.
+        # self.rate measures the speed actually achieved.
+        self.time_scale = time_scale
+        if process is not None and time_scale is not None:
+            process.time_scale = time_scale
+        self.rate = RateMeter()
+
+        # Optional scripts.process_manager.MemoryWatchdog. reset(relaunch=True)
+        # then relaunches only if it finds TORCS leaked enough memory, and
+        # restarts the race in the running simulator otherwise
+        self.watchdog = watchdog
+        if watchdog is not None and watchdog.process is None:
+            watchdog.process = process
+
+        # Optional scripts.autostart.StandbyPool. Relaunching then swaps
+        # to a warm simulator instead of restarting TORCS.
+        self.standby = standby
+
+        # Optional step_timers.StepTimers, shared with every client
+        self.timers = timers
+
+        # profile=path times every phase of step() and reset() and writes
+        # per-episode totals there (CSV, or JSON for *.json). profile=True
+        # picks a time-stamped CSV name in the working directory.
+        if profile:
+            if profile is True:
+                profile = time.strftime('profile-%Y%m%d-%H%M%S.csv')
+            self.profiler = EpisodeProfiler(profile)
+
         self.gear_change = gear_change
 
+        # Preallocated observations make_observaton fills in turn
+        self.observations = ObservationPool()
+
+        # With frame_stack=K every observation also carries the last K
+        # images as observation.frames, a (K, 64, 64, 3) view
+        self.frames = FrameStack(frame_stack) if frame_stack else None
+
+        # background=True receives and parses the server's reply in a
+        # thread, so step_async() returns as soon as the action is sent
+        if background:
+            self.requests = queue.Queue(1)
+            self.results = queue.Queue(1)
+            self.receiver = threading.Thread(target=self.receive_forever)
+            self.receiver.daemon = True
+            self.receiver.start()
+
+        # Optional observation.ImagePipeline: crop, downsample and/or
+        # greyscale the image, observation.img is then (h, w, channels)
+        self.image_pipeline = image_pipeline
+
         self.initial_run = True
 
-        self.reset_torcs()
+        if self.standby is not None:
+            self.port = self.standby.swap()
+        elif self.launch:
+            self.reset_torcs()
 
         if throttle is False:
             self.action_space = spaces.Box(low=-1.0, high=1.0, shape=(1,))
         else:
             self.action_space = spaces.Box(low=-1.0, high=1.0, shape=(2,))
 
-        high = np.array([1., np.inf, np.inf, np.inf, 1., np.inf, 1., np.inf, 255])
-        low = np.array([0., -np.inf, -np.inf, -np.inf, 0., -np.inf, 0., -np.inf, 0])
-        self.observation_space = spaces.Box(low=low, high=high)
+        if vision is False:
+            self.observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(Observation.size,))
+        else:
+            high = np.array([1., np.inf, np.inf, np.inf, 1., np.inf, 1., np.inf, 255])
+            low = np.array([0., -np.inf, -np.inf, -np.inf, 0., -np.inf, 0., -np.inf, 0])
+            self.observation_space = spaces.Box(low=low, high=high)
 
     def step(self, u):
+        self.step_async(u)
+        return self.step_wait()
+
+    def step_async(self, u):
+        """Sends the action and returns right away. The agent may work on
+        something else (but not read self.client) until step_wait()."""
+        # Time the agent spent between two steps
+        if self.timers and self.stepped_at:
+            self.timers.record('policy', time.perf_counter() - self.stepped_at)
+
+        lap = time.perf_counter() if self.profiler else None
+
         # action_torcs is a reference object to the mutators
         action_torcs = self.client.R.d
 
         # Steering
         action_torcs['steer'] = u[0]  # steering in [-1, 1]
 
-        # Adjust speed
-        self.adjust_speed()
-
-        # Adjust gear
-        self.adjust_gear()
-
-        # Apply the Agent's action into torcs
-        self.client.respond_to_server()
-
-        # Get the response of TORCS
-        self.client.get_servers_input()
-
-        # Get the current full-observation from torcs
-        obs = self.client.S.d
+        # First tick sent now, the rest are up to step_wait
+        self.lap = self.send_action(lap)
+        if self.receiver:
+            self.requests.put(self.lap)
+
+    def step_wait(self):
+        """Waits for the simulator and returns (observation, reward, done)
+        for the action given to step_async()."""
+        if not self.receiver:
+            return self.receive_step(self.lap)
+        result = self.results.get()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def receive_step(self, lap):
+        profiler = self.profiler
+
+        reward = 0
+        for tick in range(self.frame_skip):
+            if tick:
+                lap = self.send_action(lap)
+
+            # Get the response of TORCS
+            self.client.get_servers_input()
+            if profiler:
+                lap = profiler.lap('receive', lap)
+
+            # Get the current full-observation from torcs
+            obs = self.client.S.d
+            self.rate.tick(obs['curLapTime'])
+
+            # Calculate Reward
+            sp = obs['speedX']
+            progress = sp*np.cos(obs['angle'])
+
+            # Termination judgement #########################
+            if np.min(obs['track']) < 0:  # Episode is terminated if the car is out of track
+                progress = - 1
+                self.client.R.d['meta'] = True
+
+            # Episode is terminated if the agent runs backward
+            if np.cos(obs['angle']) < 0:
+                self.client.R.d['meta'] = True
+
+            reward += progress
+            if profiler:
+                lap = profiler.lap('reward', lap)
+            if self.client.R.d['meta'] is True:
+                break
 
         # Make an obsevation from a raw observation vector from TORCS
+        if self.timers:
+            started = time.perf_counter()
         self.observation = self.make_observaton(obs)
-
-        # Calculate Reward
-        track = np.array(obs['track'])
-        sp = np.array(obs['speedX'])
-        progress = sp*np.cos(obs['angle'])
-        reward = progress
-
-        # Termination judgement #########################
-        if track.min() < 0:  # Episode is terminated if the car is out of track
-            reward = - 1
-            self.client.R.d['meta'] = True
-
-        # Episode is terminated if the agent runs backward
-        if np.cos(obs['angle']) < 0:
-            self.client.R.d['meta'] = True
+        if self.timers:
+            self.timers.record('observation', time.perf_counter() - started)
+        if profiler:
+            lap = profiler.lap('observation', lap)
 
         # Send a reset signal
         if self.client.R.d['meta'] is True:
             self.initial_run = False
             self.client.respond_to_server()
+            if profiler:
+                profiler.lap('respond', lap)
 
         self.time_step += 1
+        if profiler:
+            profiler.step()
 
+        self.stepped_at = time.perf_counter()
         return self.observation, reward, self.client.R.d['meta']
 
+    def send_action(self, lap):
+        # Adjust speed
+        self.adjust_speed()
+
+        # Adjust gear
+        self.adjust_gear()
+        if self.profiler:
+            lap = self.profiler.lap('control', lap)
+
+        # Apply the Agent's action into torcs
+        self.client.respond_to_server()
+        if self.profiler:
+            lap = self.profiler.lap('respond', lap)
+        return lap
+
+    def receive_forever(self):
+        """The background receiver: runs receive_step for every action
+        step_async() sends, while the caller goes on with its own work."""
+        while True:
+            lap = self.requests.get()
+            if lap is StopIteration:
+                return
+            try:
+                self.results.put(self.receive_step(lap))
+            except Exception as e:
+                self.results.put(e)
+
     def adjust_gear(self):
         self.client.R.d['gear'] = 1
 
@@ -111,74 +275,123 @@ class Environment:
     def reset(self, relaunch=False):
         #print("Reset")
 
+        if self.profiler:
+            self.profiler.end_episode(reset=self.reset_path)
+
         self.time_step = 0
+        started = time.perf_counter()
+        path = 'connect'
 
         if self.initial_reset is not True:
-            self.client.R.d['meta'] = True
-            self.client.respond_to_server()
-
+            if self.watchdog is not None:
+                if relaunch is True:
+                    relaunch = self.watchdog.check()
+                else:
+                    self.watchdog.sample()
             ## TENTATIVE. Restarting TORCS every episode suffers the memory leak bug!
-            if relaunch is True:
-                self.reset_torcs()
-                print("### TORCS is RELAUNCHED ###")
-
-        # Modify here if you use multiple tracks in the environment
-        self.client = snakeoil3.Client(p=3101, vision=True)  # Open new UDP in vtorcs
-        self.client.MAX_STEPS = np.inf
+            if relaunch is True and (self.standby is not None or self.launch):
+                self.client.R.d['meta'] = True
+                self.client.respond_to_server()
+                self.client.shutdown()
+                self.client = None
+                if self.standby is not None:
+                    self.port = self.standby.swap()
+                    path = 'swap'
+                else:
+                    self.reset_torcs()
+                    path = 'relaunch'
+                    print("### TORCS is RELAUNCHED ###")
+                if self.watchdog is not None:
+                    self.watchdog.relaunched()
+            else:
+                # Same simulator: restart the race over the same socket
+                self.client.restart()
+                path = 'soft'
+
+        if self.client is None:
+            # Modify here if you use multiple tracks in the environment
+            self.client = snakeoil3.Client(p=self.port, vision=self.vision, timers=self.timers,
+                                           encoder=snakeoil3.ActionEncoder(),
+                                           sensors_only=not self.vision,
+                                           relaunch=self.launch and self.process is None and self.standby is None)  # Open new UDP in vtorcs
+            self.client.MAX_STEPS = np.inf
+            if self.time_scale and self.launch and self.process is None and self.standby is None:
+                TorcsInstance(vision=self.vision, time_scale=self.time_scale).speed_up()
 
         self.client.get_servers_input()  # Get the initial input from torcs
+        self.rate.reset(self.client.S.d['curLapTime'])
+
+        # Time to the first observation of the new episode, per path
+        self.reset_path = path
+        self.reset_seconds = time.perf_counter() - started
+        if self.timers:
+            self.timers.record('reset_' + path, self.reset_seconds)
+        if self.profiler:
+            lap = self.profiler.lap('reset', started)
 
         obs = self.client.S.d  # Get the current full-observation from torcs
+        if self.frames:
+            self.frames.clear()  # Nothing from the last episode
         self.observation = self.make_observaton(obs)
+        if self.profiler:
+            self.profiler.lap('observation', lap)
 
         self.last_u = None
 
         self.initial_reset = False
+        self.stepped_at = time.perf_counter()
         return self.observation
 
+    def close(self):
+        if self.receiver:
+            self.requests.put(StopIteration)
+            self.receiver.join()
+            self.receiver = None
+        if self.profiler:
+            self.profiler.end_episode(reset=self.reset_path)
+        if getattr(self, 'client', None) is not None and self.client.so:
+            self.client.shutdown()
+        if self.standby is not None:
+            self.standby.close()  # The active simulator and the warm ones
+        elif self.launch:
+            self.close_torcs()
+
     def close_torcs(self):
-        torcs_instance = TorcsInstance()
+        if self.process is not None:
+            self.process.stop()
+            return
+        torcs_instance = TorcsInstance(vision=self.vision)
         torcs_instance.stop()
 
     def reset_torcs(self):
+        if self.process is not None:
+            self.process.restart()  # Returns once it answers on its port
+            return
         self.close_torcs()
-        torcs_instance = TorcsInstance()
+        torcs_instance = TorcsInstance(vision=self.vision)
         torcs_instance.start()
 
-    def obs_vision_to_image_rgb(self, obs_image_vec):
-        image_vec =  obs_image_vec
-        rgb = []
-        temp = []
-        # convert size 64x64x3 = 12288 to 64x64=4096 2-D list
+    def obs_vision_to_image_rgb(self, obs_image_vec, shape=(-1, 3)):
+        # convert size 64x64x3 = 12288 to 4096x3 (or 64x64x3)
         # with rgb values grouped together.
         # Format similar to the observation in openai gym
-        for i in range(0,12286,3):
-            temp.append(image_vec[i])
-            temp.append(image_vec[i+1])
-            temp.append(image_vec[i+2])
-            rgb.append(temp)
-            temp = []
-        return np.array(rgb, dtype=np.uint8)
+        return snakeoil3.image_to_rgb(obs_image_vec, shape)
 
     def make_observaton(self, raw_obs):
-        names = ['focus',
-                 'speedX', 'speedY', 'speedZ',
-                 'opponents',
-                 'rpm',
-                 'track',
-                 'wheelSpinVel',
-                 'img', 'trackPos']
-        Observation = col.namedtuple('Observaion', names)
-
-        # Get RGB from observation
-        image_rgb = self.obs_vision_to_image_rgb(raw_obs[names[8]])
-
-        return Observation(focus=np.array(raw_obs['focus'], dtype=np.float32)/200.,
-                           speedX=np.array(raw_obs['speedX'], dtype=np.float32)/self.default_speed,
-                           speedY=np.array(raw_obs['speedY'], dtype=np.float32)/self.default_speed,
-                           speedZ=np.array(raw_obs['speedZ'], dtype=np.float32)/self.default_speed,
-                           opponents=np.array(raw_obs['opponents'], dtype=np.float32)/200.,
-                           rpm=np.array(raw_obs['rpm'], dtype=np.float32),
-                           track=np.array(raw_obs['track'], dtype=np.float32)/200.,
-                           wheelSpinVel=np.array(raw_obs['wheelSpinVel'], dtype=np.float32),
-                           img=image_rgb, trackPos=np.array(raw_obs['trackPos'], dtype=np.float32))
+        if not self.vision:
+            # Sensor-only: one packed vector, filled in place
+            return self.observations.fill(raw_obs, self.default_speed).to_vector()
+
+        # Get RGB from observation. The client decodes it straight into a
+        # reusable (64, 64, 3) uint8 buffer, which only needs a view here.
+        image_rgb = self.obs_vision_to_image_rgb(raw_obs['img'])
+        if self.image_pipeline:
+            image_rgb = self.image_pipeline(image_rgb)
+
+        # Filled in place, it stays valid for one more step (see observation.py)
+        observation = self.observations.fill(raw_obs, self.default_speed, image_rgb)
+        if self.frames:
+            # Only valid until the next step, the ring moves on
+            img = observation.img
+            observation.frames = self.frames.push(img if img.ndim == 3 else img.reshape(64, 64, -1))
+        return observation
@@ -0,0 +1,206 @@
+"""Preallocated observations for the Environment and the data collector.
+
+make_observaton used to build a namedtuple class and ten small numpy
+arrays on every step. An ObservationPool instead holds a couple of
+Observation objects whose float32 fields are views into one flat
+vector, and fills the next one in place each step:
+
+    pool = ObservationPool()
+    ob = pool.fill(client.S.d, speed_scale=10)
+    _, _, _, _, _, _, track, _, vision, trackPos = ob   # as before
+    net_input = ob.to_vector()                           # no concatenation
+
+to_vector() layout, in float32 (values scaled as noted):
+
+    [0:5]    focus / 200          [44]     rpm
+    [5]      speedX / speed_scale [45:64]  track / 200
+    [6]      speedY / speed_scale [64:68]  wheelSpinVel
+    [7]      speedZ / speed_scale [68]     trackPos
+    [8:44]   opponents / 200
+
+In the Environment's sensor-only mode (vision=False) that vector is the
+whole observation.
+
+With the default two buffers an observation stays valid until the step
+after the one that produced it, which is enough to keep (s, s') pairs
+around. Copy it (ob.copy()) to keep it any longer.
+"""
+import numpy as np
+
+
+class Observation:
+    """The fields the agents read, unpackable like the old namedtuple.
+
+    focus, speedX/Y/Z, opponents, rpm, track, wheelSpinVel and trackPos are
+    float32 views into one vector (the scalars as 0-d views), img is a
+    (4096, 3) uint8 RGB array, or (h, w, channels) from an ImagePipeline.
+    """
+
+    names = ['focus',
+             'speedX', 'speedY', 'speedZ',
+             'opponents',
+             'rpm',
+             'track',
+             'wheelSpinVel',
+             'img', 'trackPos']
+    # Sensor, number of values. Their order in to_vector().
+    layout = [('focus', 5),
+              ('speedX', 1), ('speedY', 1), ('speedZ', 1),
+              ('opponents', 36),
+              ('rpm', 1),
+              ('track', 19),
+              ('wheelSpinVel', 4),
+              ('trackPos', 1)]
+    size = sum([n for _, n in layout])
+
+    __slots__ = names + ['vector', 'frames']
+
+    def __init__(self):
+        self.vector = np.zeros(self.size, dtype=np.float32)
+        start = 0
+        for name, n in self.layout:
+            view = self.vector[start:start + n]
+            setattr(self, name, view if n > 1 else view.reshape(()))
+            start += n
+        self.img = np.zeros((64 * 64, 3), dtype=np.uint8)
+        self.frames = None  # The last K images, with a FrameStack.
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        return getattr(self, self.names[i])
+
+    def to_vector(self):
+        """Every float field, flat, in layout order. A view, not a copy."""
+        return self.vector
+
+    def copy(self):
+        ob = Observation()
+        ob.vector[:] = self.vector
+        ob.img = self.img.copy()
+        if self.frames is not None:
+            ob.frames = self.frames.copy()
+        return ob
+
+
+class ObservationPool:
+    """Round-robin over size preallocated Observations."""
+
+    def __init__(self, size=2):
+        self.observations = [Observation() for _ in range(size)]
+        self.position = 0
+
+    def next(self):
+        ob = self.observations[self.position]
+        self.position = (self.position + 1) % len(self.observations)
+        return ob
+
+    def fill(self, raw_obs, speed_scale, img=None):
+        """Scales the sensors of raw_obs (ServerState.d) into the next
+        observation. img is the RGB image if the caller converted it
+        already, otherwise raw_obs['img'] is used. Without either (a
+        sensor-only run) ob.img is left alone. img is kept in the shape
+        given, raw_obs['img'] becomes (4096, 3)."""
+        ob = self.next()
+        scales = [200., speed_scale, speed_scale, speed_scale, 200., 1., 200., 1., 1.]
+        for (name, _), scale in zip(Observation.layout, scales):
+            np.divide(raw_obs[name], scale, out=getattr(ob, name))
+        if img is None:
+            img = raw_obs.get('img')
+            if img is None:
+                return ob
+            # The client's (64, 64, 3) buffer, in the documented (4096, 3)
+            img = np.asarray(img, dtype=np.uint8).reshape(-1, 3)
+        img = np.asarray(img, dtype=np.uint8)
+        if ob.img.shape != img.shape:  # Cropped, greyscale or another resolution.
+            ob.img = np.empty_like(img)
+        ob.img[...] = img
+        return ob
+
+
+class FrameStack:
+    """The last k frames, oldest first, without copying them every step.
+
+    The ring holds k + 1 frames in 2(k + 1) slots, each frame written
+    twice, at i and i + k + 1, so the last k frames are always a
+    contiguous slice. push() returns that slice, a (k, ...) view. The
+    extra frame keeps the next push() away from it, so like the
+    observations of an ObservationPool it stays valid one more step. The
+    frame shape, e.g. (64, 64, 3), is taken from the first frame pushed.
+    Until k frames came in since clear(), the older slots are zeros.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.buffer = None
+        self.position = 0
+
+    def clear(self):
+        if self.buffer is not None:
+            self.buffer.fill(0)
+        self.position = 0
+
+    def push(self, frame):
+        m = self.k + 1
+        if self.buffer is None or self.buffer.shape[1:] != frame.shape:
+            self.buffer = np.zeros((2 * m,) + frame.shape, dtype=np.uint8)
+        p = self.position
+        self.buffer[p] = frame
+        self.buffer[p + m] = frame
+        self.position = (p + 1) % m
+        return self.buffer[p + 2:p + m + 1]  # Slot p + 1, the oldest, is left out.
+
+
+class ImagePipeline:
+    """Crops, downsamples and greyscales a (64, 64, 3) uint8 frame.
+
+    crop=(top, bottom, left, right) keeps img[top:bottom, left:right],
+    e.g. (32, 64, 0, 64) drops the sky. factor averages factor x factor
+    blocks, both crop sides must be multiples of it. grey converts with
+    the weights data_feeder.rgb2gray uses, so collected data and training
+    data match. The result, (h, w, 3) or (h, w, 1), is a reused buffer.
+    """
+
+    def __init__(self, crop=None, factor=1, grey=False):
+        self.crop = crop or (0, 64, 0, 64)
+        self.factor = factor
+        self.grey = grey
+        top, bottom, left, right = self.crop
+        if (bottom - top) % factor or (right - left) % factor:
+            raise ValueError('crop %r does not divide by %d' % (self.crop, factor))
+        h, w = (bottom - top) // factor, (right - left) // factor
+        self.shape = (h, w, 1 if grey else 3)
+        self.out = np.empty(self.shape, dtype=np.uint8)
+        # Scratch space, so that a frame allocates nothing.
+        self.sum = np.empty((h, w, 3), dtype=np.uint16)
+        self.mean = np.empty((h, w, 3), dtype=np.uint8)
+        self.luma = np.empty((h, w), dtype=np.uint32)
+        self.channel = np.empty((h, w), dtype=np.uint32)
+
+    def __call__(self, img):
+        top, bottom, left, right = self.crop
+        img = img.reshape(64, 64, 3)[top:bottom, left:right]  # A view.
+        f = self.factor
+        if f > 1:
+            self.sum.fill(0)
+            for i in range(f):
+                for j in range(f):
+                    np.add(self.sum, img[i::f, j::f], out=self.sum)
+            np.floor_divide(self.sum, f * f, out=self.mean, casting='unsafe')
+            img = self.mean
+        if not self.grey:
+            self.out[...] = img
+            return self.out
+        # Integer version of data_feeder.rgb2gray.
+        np.multiply(img[..., 0], 299, out=self.luma, dtype=np.uint32)
+        for c, weight in [(1, 587), (2, 144)]:
+            np.multiply(img[..., c], weight, out=self.channel, dtype=np.uint32)
+            np.add(self.luma, self.channel, out=self.luma)
+        np.floor_divide(self.luma, 1000, out=self.luma)
+        np.minimum(self.luma, 255, out=self.luma)
+        self.out[..., 0] = self.luma
+        return self.out
@@ -1,6 +1,11 @@
 from gym_torcs import TorcsEnv
 from sample_agent import Agent
 import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from memory_watchdog import MemoryWatchdog
 
 
 vision = True
@@ -14,6 +19,7 @@ step = 0
 env = TorcsEnv(vision=vision, throttle=False)
 
 agent = Agent(1)  # steering only
+watchdog = MemoryWatchdog(limit_mb=1024)
 
 
 print("TORCS Experiment Start.")
@@ -21,8 +27,12 @@ for i in range(episode_count):
     print("Episode : " + str(i))
 
     if np.mod(i, 3) == 0:
-        # Sometimes you need to relaunch TORCS because of the memory leak error
-        ob = env.reset(relaunch=True)
+        # Sometimes you need to relaunch TORCS because of the memory leak error,
+        # the watchdog tells when it leaked enough
+        relaunch = watchdog.check()
+        ob = env.reset(relaunch=relaunch)
+        if relaunch:
+            watchdog.relaunched()
     else:
         ob = env.reset()
 
@@ -45,5 +55,6 @@ for i in range(episode_count):
     print("Total Step: " + str(step))
     print("")
 
+print(watchdog.summary())
 env.end()  # This is for shutting down TORCS
 print("Finish.")
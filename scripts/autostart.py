@@ -1,28 +1,156 @@
 import os
+import subprocess
+import sys
+import threading
 import time
+from scripts.race_config import RaceConfig
+from scripts.time_scale import speed_up
+
 
 class TorcsInstance:
+	executable = u'torcs'
+	# The race set by changeTrack(). Headless starts run it, windowed ones
+	# find it as the quick race autostart.sh walks the menus into. None is
+	# the last quick race set up in the menus.
+	race = None
+	quickrace = os.path.expanduser(u'~/.torcs/config/raceman/quickrace.xml')
+
+	def __init__(self, vision=True, time_scale=1, headless=None):
+		# Without -vision TORCS skips rendering the img sensor.
+		self.vision = vision
+		# Simulated seconds per wall-clock second, applied by speed_up().
+		self.time_scale = time_scale
+		# A headless start is torcs -r <race file>: the race runs on the
+		# console, without the window the img sensor is rendered from and
+		# key presses go to. So only sensor-only runs start that way by
+		# default, vision runs open the window and walk the menus.
+		self.headless = not vision if headless is None else headless
+
+	def command(self):
+		options = u'-nofuel -nodamage -nolaptime' + (u' -vision' if self.vision else u'')
+		if not self.headless:
+			return u'%s %s &' % (self.executable, options)
+		if TorcsInstance.race is None:
+			race = self.quickrace
+		else:
+			race = TorcsInstance.race.write()
+		return u'%s %s -r %s &' % (self.executable, options, race)
 
 	def start(self):
 		print("Relaunch Torcs 1.0")
 		self.__close()
 		self.__sleep()
-		os.system(u'torcs -nofuel -nodamage -nolaptime -vision &')
-		self.__sleep()
-		os.system(u'sh scripts/autostart.sh')
+		os.system(self.command())
+		if not self.headless:
+			self.__sleep()
+			os.system(u'sh scripts/autostart.sh')
 
-	def changeTrack(self):
-		print("Changing Track 1.0")
+	def speed_up(self):
+		"""Applies time_scale to the running race. A headless race has no
+		window to press keys in, and runs as fast as the client answers."""
+		if self.time_scale != 1 and not self.headless:
+			speed_up(self.time_scale)
+
+	def changeTrack(self, track=None, category='road', laps=1, port=3101):
+		"""Makes start() race on track (a random one of category if None)
+		from now on, for every TorcsInstance. A windowed start races the
+		quick race the menus load, so the race is written there too."""
+		if track is None:
+			TorcsInstance.race = RaceConfig.random(category, laps=laps, port=port)
+		else:
+			TorcsInstance.race = RaceConfig(track, category, laps=laps, port=port)
+		if not self.headless:
+			TorcsInstance.race.write(self.quickrace)
+		print("Changing Track to %s" % TorcsInstance.race.track)
+
+	def stop(self):
 		self.__close()
-		self.__sleep()
-		os.system(u'torcs -nofuel -nodamage -nolaptime -vision &')
-		self.__sleep()
-		os.system(u'sh scripts/random_autostart.sh')
+
+	def close(self):
 		self.__close()
-		self.__sleep()
+
+	def sleep(self, seconds=2.0):
+		self.__sleep(seconds)
 
 	def __close(self):
 		os.system(u'pkill torcs')
 
 	def __sleep(self, seconds=2.0):
 		time.sleep(seconds)
+
+
+class SimulatorProcess:
+	"""A simulator running as a subprocess of ours."""
+
+	def __init__(self, args):
+		self.process = subprocess.Popen(args)
+
+	def stop(self):
+		self.process.terminate()
+		self.process.wait()
+
+
+def stand_in(port, time_scale=1):
+	"""Launches the SCR stand-in server (scripts/scr_server.py) on port."""
+	return SimulatorProcess([sys.executable, '-m', 'scripts.scr_server', '--port', str(port),
+							 '--time-scale', str(time_scale)])
+
+
+def torcs_process(port, **kwargs):
+	"""Launches TORCS on port as a process_manager.TorcsProcess and waits
+	until it is up, e.g. StandbyPool(functools.partial(torcs_process,
+	xvfb=True), ports). kwargs go to the TorcsProcess."""
+	from scripts.process_manager import TorcsProcess
+	return TorcsProcess(port, **kwargs).start()
+
+
+class StandbyPool:
+	"""Simulators launched ahead of time, so that a relaunch is a swap.
+
+	launch(port) starts a simulator serving on port and returns something
+	with a stop() method, e.g. torcs_process. Every port but the active one holds a warm
+	standby. swap() stops the active simulator, hands out the port of a
+	standby and launches the replacement in the background, off the
+	training loop's clock.
+	"""
+
+	def __init__(self, launch, ports):
+		self.launch = launch
+		self.standby = []  # (port, simulator), oldest first.
+		self.active = None
+		self.lock = threading.Lock()
+		self.threads = []
+		for port in ports:
+			self.standby.append((port, self.launch(port)))
+
+	def swap(self):
+		"""Returns the port of a warm simulator, which is now the active one."""
+		if not self.standby:
+			self.wait()  # All of them are still starting.
+		with self.lock:
+			old, self.active = self.active, self.standby.pop(0)
+		if old is not None:
+			thread = threading.Thread(target=self.replace, args=(old,))
+			thread.daemon = True
+			thread.start()
+			self.threads = [t for t in self.threads if t.is_alive()] + [thread]
+		return self.active[0]
+
+	def replace(self, old):
+		port, simulator = old
+		simulator.stop()
+		simulator = self.launch(port)
+		with self.lock:
+			self.standby.append((port, simulator))
+
+	def wait(self):
+		for thread in self.threads:
+			thread.join()
+		self.threads = []
+
+	def close(self):
+		self.wait()
+		for port, simulator in self.standby + ([self.active] if self.active else []):
+			simulator.stop()
+		self.standby = []
+		self.active = None
@@ -0,0 +1,262 @@
+"""Microbenchmarks for the client hot path. No simulator needed.
+
+Run from the repository root:
+	python -m scripts.benchmark [parser ...]
+
+launch is left out unless named: it stops every process called torcs.
+"""
+import sys
+import time
+import numpy as np
+import snakeoil3_gym as snakeoil3
+
+
+def sample_sensors(vision=True):
+	"""A plausible set of sensor values, as the server would report them."""
+	rng = np.random.RandomState(0)
+	d = {'angle': 0.00346,
+		 'curLapTime': 12.34,
+		 'damage': 0,
+		 'distFromStart': 1523.7,
+		 'distRaced': 221.5,
+		 'focus': [-1, -1, -1, -1, -1],
+		 'fuel': 94,
+		 'gear': 2,
+		 'lastLapTime': 0,
+		 'opponents': [200] * 36,
+		 'racePos': 1,
+		 'rpm': 5422.17,
+		 'speedX': 61.3245,
+		 'speedY': -0.227,
+		 'speedZ': -0.0125,
+		 'track': list(np.round(rng.uniform(1, 200, 19), 4)),
+		 'trackPos': 0.0333,
+		 'wheelSpinVel': [52.42, 52.41, 53.1, 53.12],
+		 'z': 0.3456}
+	if vision:
+		d['img'] = list(rng.randint(0, 256, 64 * 64 * 3))
+	return d
+
+
+def sample_datagram(vision=True):
+	return snakeoil3.compose_server_str(sample_sensors(vision)).encode()
+
+
+def timeit(fn, n):
+	"""Returns the mean time of fn() in microseconds."""
+	fn()  # Warm up.
+	start = time.perf_counter()
+	for _ in range(n):
+		fn()
+	return (time.perf_counter() - start) / n * 1e6
+
+
+def report(name, us):
+	print("%-40s %10.1f us %10.0f /s" % (name, us, 1e6 / us))
+
+
+# What drive_example() reads on every step.
+drive_keys = ['angle', 'trackPos', 'speedX', 'wheelSpinVel', 'track', 'lastLapTime']
+
+
+def bench_parser(n=500):
+	"""ServerState: the dict of float lists, the preallocated record and
+	the lazy state, parsing and then reading what drive() reads."""
+	for vision in [False, True]:
+		data = sample_datagram(vision)
+		tag = 'vision' if vision else 'no vision'
+		for parser in ['dict', 'record', 'lazy']:
+			state = snakeoil3.make_server_state(parser)
+
+			def step():
+				state.parse_server_bytes(data)
+				for k in drive_keys:
+					state.d[k]
+			report('parse %s (%s)' % (parser, tag), timeit(step, n))
+
+
+def bench_client(steps=2000):
+	"""Client against the SCR stand-in in lockstep: the whole round trip."""
+	from scripts.scr_server import StandInServer
+	for vision in [False, True]:
+		for parser in ['dict', 'record', 'lazy']:
+			server = StandInServer(port=0, rate=0, vision=vision, laps=1000).start()
+			C = snakeoil3.Client(p=server.port, parser=parser)
+			start = time.perf_counter()
+			for _ in range(steps):
+				C.get_servers_input()
+				C.respond_to_server()
+			us = (time.perf_counter() - start) / steps * 1e6
+			C.shutdown()
+			server.stop()
+			report('client %s (%s)' % (parser, 'vision' if vision else 'no vision'), us)
+
+
+def bench_encoder(n=20000):
+	"""DriverAction replies: repr(R) against ActionEncoder, single and batched."""
+	R = snakeoil3.DriverAction()
+	R.d['steer'] = 1.7  # Needs clipping.
+	encoder = snakeoil3.ActionEncoder()
+	assert encoder.encode_action(R) == repr(R).encode()
+	report('repr(R).encode()', timeit(lambda: repr(R).encode(), n))
+	report('ActionEncoder.encode_action(R)', timeit(lambda: encoder.encode_action(R), n))
+	row = [R.d[k] for k in snakeoil3.action_columns]
+	assert encoder.encode(row) == repr(R).encode()
+	for cars in [1, 32, 256]:
+		actions = np.tile(row, (cars, 1))
+		us = timeit(lambda: encoder.encode_batch(actions), max(1, n // cars))
+		report('ActionEncoder.encode_batch, per car (%d)' % cars, us / cars)
+
+
+def loop_image_rgb(image_vec):
+	"""The per-pixel loop obs_vision_to_image_rgb used to run."""
+	rgb = []
+	for i in range(0, 12286, 3):
+		rgb.append([image_vec[i], image_vec[i + 1], image_vec[i + 2]])
+	return np.array(rgb, dtype=np.uint8)
+
+
+def bench_image(n=500):
+	"""The img sensor to RGB pixels: the old loop against image_to_rgb, on
+	a list of floats (as destringify gives) and on ServerState's buffer."""
+	pixels = [float(p) for p in sample_sensors()['img']]
+	expected = np.array(pixels, dtype=np.uint8).reshape(64, 64, 3)
+	state = snakeoil3.make_server_state('record')
+	state.parse_server_bytes(sample_datagram())
+	for img in [pixels, state.d['img']]:
+		# All 4096 pixels, the last one included.
+		assert (snakeoil3.image_to_rgb(img, (64, 64, 3)) == expected).all()
+		assert (snakeoil3.image_to_rgb(img) == expected.reshape(4096, 3)).all()
+	assert np.shares_memory(snakeoil3.image_to_rgb(state.d['img']), state.img)
+	report('per-pixel loop (float list)', timeit(lambda: loop_image_rgb(pixels), n))
+	report('image_to_rgb (float list)', timeit(lambda: snakeoil3.image_to_rgb(pixels), n))
+	report('image_to_rgb (uint8 buffer)', timeit(lambda: snakeoil3.image_to_rgb(state.d['img']), n * 100))
+
+
+def namedtuple_observation(raw_obs, speed):
+	"""make_observaton as it was: a namedtuple class and ten arrays a step."""
+	import collections as col
+	names = ['focus', 'speedX', 'speedY', 'speedZ', 'opponents', 'rpm', 'track', 'wheelSpinVel', 'img', 'trackPos']
+	Observation = col.namedtuple('Observaion', names)
+	return Observation(focus=np.array(raw_obs['focus'], dtype=np.float32)/200.,
+					   speedX=np.array(raw_obs['speedX'], dtype=np.float32)/speed,
+					   speedY=np.array(raw_obs['speedY'], dtype=np.float32)/speed,
+					   speedZ=np.array(raw_obs['speedZ'], dtype=np.float32)/speed,
+					   opponents=np.array(raw_obs['opponents'], dtype=np.float32)/200.,
+					   rpm=np.array(raw_obs['rpm'], dtype=np.float32),
+					   track=np.array(raw_obs['track'], dtype=np.float32)/200.,
+					   wheelSpinVel=np.array(raw_obs['wheelSpinVel'], dtype=np.float32),
+					   img=snakeoil3.image_to_rgb(raw_obs['img']),
+					   trackPos=np.array(raw_obs['trackPos'], dtype=np.float32))
+
+
+def bench_observation(n=5000):
+	"""make_observaton: a namedtuple per step against the ObservationPool."""
+	from observation import ObservationPool
+	for parser in ['dict', 'record']:
+		state = snakeoil3.make_server_state(parser)
+		state.parse_server_bytes(sample_datagram())
+		pool = ObservationPool()
+		old, new = namedtuple_observation(state.d, 10), pool.fill(state.d, 10)
+		for a, b in zip(old, new):
+			assert np.allclose(a, b)
+		assert new.img.shape == (4096, 3)
+		assert new.to_vector().size == sum([np.size(v) for v in new]) - new.img.size
+		report('namedtuple observation (%s)' % parser, timeit(lambda: namedtuple_observation(state.d, 10), n))
+		report('ObservationPool.fill (%s)' % parser, timeit(lambda: pool.fill(state.d, 10), n))
+
+
+def bench_launch(timeout=10.):
+	"""Starting simulators, through scripts/fake_torcs.py: checks the
+	command line they got and the race files, and times it. Ends with
+	TorcsInstance.stop(), which is pkill torcs."""
+	import json
+	import os
+	import re
+	import tempfile
+	from scripts.autostart import TorcsInstance
+	from scripts.process_manager import ProcessManager, TorcsProcess, udp_bound
+	from scripts.race_config import RaceConfig
+	fake = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_torcs.py')
+	log = tempfile.NamedTemporaryFile(suffix='.log', delete=False).name
+	os.environ['FAKE_TORCS_LOG'] = log
+
+	def raced(path, track, idx):
+		with open(path) as f:
+			xml = f.read()
+		assert '<attstr name="name" val="%s"/>' % track in xml
+		assert re.findall(r'<attnum name="(?:focused )?idx" val="(\d+)"/>', xml) == [str(idx)] * 2
+
+	def logged(path, track, idx, last=1):
+		raced(path, track, idx)
+		with open(log) as f:
+			return [json.loads(line) for line in f.read().splitlines()[-last:]]
+
+	def wait(port, bound=True):
+		deadline = time.monotonic() + timeout
+		while udp_bound(port) != bound:
+			assert time.monotonic() < deadline, 'port %d still %s' % (port, 'free' if bound else 'bound')
+			time.sleep(0.01)
+
+	process = TorcsProcess(3108, args=[fake], race=RaceConfig('e-track-6', laps=2), vision=False)
+	start = time.perf_counter()
+	process.start()
+	report('TorcsProcess start (fake torcs)', (time.perf_counter() - start) * 1e6)
+	try:
+		assert logged(process.race.path(), 'e-track-6', 7) == [['-r', process.race.path()]]
+	finally:
+		process.stop()
+	assert not udp_bound(3108)
+
+	# Windowed TORCS, two of them, each with its race as its own quick race.
+	executable = TorcsProcess.executable
+	TorcsProcess.executable = fake
+	manager = ProcessManager(2, first_port=3108, race=RaceConfig('e-track-6'))
+	try:
+		start = time.perf_counter()
+		manager.start()
+		report('ProcessManager start, 2 windowed (fake torcs)', (time.perf_counter() - start) * 1e6)
+		for i, instance in enumerate(manager.instances):
+			quickrace = os.path.join(instance.home(), '.torcs', 'config', 'raceman', 'quickrace.xml')
+			assert logged(quickrace, 'e-track-6', 7 + i, last=2) == [['-nofuel', '-nodamage', '-nolaptime', '-vision']] * 2
+	finally:
+		manager.stop()
+		TorcsProcess.executable = executable
+
+	executable, race, quickrace = TorcsInstance.executable, TorcsInstance.race, TorcsInstance.quickrace
+	TorcsInstance.quickrace = os.path.join(tempfile.mkdtemp(), 'quickrace.xml')
+	windowed = TorcsInstance(vision=True)
+	assert ' -r ' not in windowed.command()  # Through the menus, into the quick race.
+	windowed.changeTrack('dirt-2', port=3109)
+	raced(TorcsInstance.quickrace, 'dirt-2', 8)
+	os.remove(TorcsInstance.quickrace)
+	TorcsInstance.executable = fake
+	instance = TorcsInstance(vision=False)
+	try:
+		instance.changeTrack('dirt-2', port=3109)
+		start = time.perf_counter()
+		instance.start()
+		wait(3109)
+		report('TorcsInstance start (fake torcs)', (time.perf_counter() - start) * 1e6)
+		assert logged(TorcsInstance.race.path(), 'dirt-2', 8) == [['-nofuel', '-nodamage', '-nolaptime',
+																	'-r', TorcsInstance.race.path()]]
+	finally:
+		instance.stop()
+		TorcsInstance.executable, TorcsInstance.race, TorcsInstance.quickrace = executable, race, quickrace
+		os.remove(log)
+	wait(3109, bound=False)  # pkill torcs got it.
+
+
+benchmarks = {'parser': bench_parser,
+			  'observation': bench_observation,
+			  'image': bench_image,
+			  'encoder': bench_encoder,
+			  'client': bench_client,
+			  'launch': bench_launch}
+
+if __name__ == "__main__":
+	names = sys.argv[1:] or sorted(set(benchmarks) - {'launch'})
+	del sys.argv[1:]  # The Client parses the command line too.
+	for name in names:
+		print("== %s" % name)
+		benchmarks[name]()
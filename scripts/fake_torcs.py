@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""A stand-in for the torcs executable, for checking launchers.
+
+It appends the command line it got, as one JSON list, to the file named
+by FAKE_TORCS_LOG (default /tmp/fake_torcs.log). It then serves the SCR
+stand-in on the port of the race it got with -r, or else of the quick
+race in $HOME/.torcs (as if the menus had started it), until it is
+killed. So readiness checks and clients work as with TORCS:
+
+	TorcsInstance.executable = 'scripts/fake_torcs.py'
+	TorcsProcess(3102, args=['scripts/fake_torcs.py'], race=RaceConfig('e-track-6'))
+
+python -m scripts.benchmark launch checks both launchers with it.
+"""
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if __name__ == "__main__":
+	try:  # Named like TORCS, so pkill torcs stops it too.
+		with open('/proc/self/comm', 'w') as comm:
+			comm.write('torcs')
+	except (IOError, OSError):
+		pass
+	with open(os.environ.get('FAKE_TORCS_LOG', '/tmp/fake_torcs.log'), 'a') as log:
+		log.write(json.dumps(sys.argv[1:]) + '\n')
+	if '-r' in sys.argv:
+		race = sys.argv[sys.argv.index('-r') + 1]
+	else:
+		race = os.path.expanduser('~/.torcs/config/raceman/quickrace.xml')
+	if not os.path.exists(race):
+		sys.exit(0)
+	from scripts import race_config
+	from scripts.scr_server import StandInServer
+	with open(race) as f:
+		idx = int(re.search(r'<attnum name="idx" val="(\d+)"/>', f.read()).group(1))
+	server = StandInServer(port=race_config.base_port + idx, vision='-vision' in sys.argv, laps=1000)
+	server.serve_forever()
@@ -0,0 +1,159 @@
+"""Pinning simulators and their clients to cores, and sizing fleets.
+
+Left to the kernel, many TORCS + Client pairs on one host migrate between
+cores and preempt each other, and the 50 Hz control loop jitters. A
+HostScheduler packs instances onto the cores by their budget and pins
+instance i to a core set, shared by its simulator and its client (they
+take turns anyway), or split between them when it has more than one
+core. Instances under a core each share a set, neighbours over a core
+overlap on one:
+
+	scheduler = HostScheduler(budget=1.3, reserve=2)   # 2 cores for the learner
+	scheduler.capacity()                                # instances this host takes
+	env = VectorEnvironment(scheduler.capacity(), torcs=dict(xvfb=True), scheduler=scheduler)
+	...
+	for row in env.report():                            # ticks/s and CPU per instance
+		print(format_report(row))
+
+budget is the CPU, in cores, one simulator and its client use together.
+Measure it on the host rather than guess: measure_budget() runs an
+Environment for a while and reports its tick rate and CPU use, so does
+VectorEnvironment.report() for every instance of a running fleet.
+
+	python -m scripts.host_scheduler --measure 1000 --stand-in
+	python -m scripts.host_scheduler --budget 1.3 --reserve 2
+"""
+import math
+import os
+import sys
+import time
+import numpy as np
+from scripts.process_manager import group_cpu_seconds
+
+
+class HostScheduler:
+	"""Core sets for instances 0, 1, ... of this host.
+
+	cores are the CPUs to use, by default the ones this process may run
+	on, less the first reserve of them. They take len(cores) / budget
+	instances (budget 1 if None), instance i getting the ceil(budget)
+	cores from where the first i budgets end.
+	"""
+
+	def __init__(self, budget=None, cores=None, reserve=0):
+		if cores is None:
+			cores = sorted(os.sched_getaffinity(0))
+		self.cores = list(cores)[reserve:]
+		self.budget = budget or 1.
+		self.per_instance = max(1, int(math.ceil(self.budget - 1e-9)))
+		if not self.capacity():
+			raise ValueError('%d cores left, an instance needs %g' % (len(self.cores), self.budget))
+
+	def capacity(self):
+		"""How many instances fit, budget cores each."""
+		return int(math.floor(len(self.cores) / self.budget + 1e-9))
+
+	def check(self, count):
+		if count > self.capacity():
+			raise ValueError('%d instances asked for, this host takes %d at %g cores each'
+							 % (count, self.capacity(), self.budget))
+
+	def instance_cores(self, i):
+		self.check(i + 1)
+		first = min(int(math.floor(i * self.budget + 1e-9)), len(self.cores) - self.per_instance)
+		return self.cores[first:first + self.per_instance]
+
+	def simulator_cores(self, i):
+		"""The simulator's share: all of the set, or all but its last core."""
+		cores = self.instance_cores(i)
+		return set(cores[:-1] if len(cores) > 1 else cores)
+
+	def client_cores(self, i):
+		return set(self.instance_cores(i)[-1:])
+
+	def pin_client(self, i):
+		"""Pins the calling process, the client of instance i."""
+		os.sched_setaffinity(0, self.client_cores(i))
+
+
+class InstanceMeter:
+	"""Tick rate and CPU use of an Environment and its simulator since
+	start(). Simulator CPU is only known for an Environment with a
+	TorcsProcess, and restarts with every relaunch."""
+
+	def __init__(self, env):
+		self.env = env
+		self.start()
+
+	def simulator_seconds(self):
+		process = self.env.process
+		if process is None or not process.running():
+			return 0.
+		return group_cpu_seconds(process.process.pid)
+
+	def start(self):
+		self.started = time.perf_counter()
+		self.client = time.process_time()
+		self.simulator = self.simulator_seconds()
+		self.steps = self.env.rate.total_steps
+		self.sim_seconds = self.env.rate.total_sim_seconds
+
+	def report(self):
+		seconds = time.perf_counter() - self.started
+		if not seconds:
+			seconds = float('inf')
+		process = self.env.process
+		return {'port': self.env.port,
+				'cores': sorted(process.cores) if process is not None and process.cores else None,
+				'ticks_per_second': (self.env.rate.total_steps - self.steps) / seconds,
+				'time_scale': (self.env.rate.total_sim_seconds - self.sim_seconds) / seconds,
+				'simulator_cpu': max(0., self.simulator_seconds() - self.simulator) / seconds,
+				'client_cpu': (time.process_time() - self.client) / seconds}
+
+
+def format_report(row):
+	return ('port %(port)d: %(ticks_per_second).0f ticks/s at %(time_scale).1fx, '
+			'CPU simulator %(simulator_cpu).2f client %(client_cpu).2f cores' % row)
+
+
+def measure_budget(env, steps=1000):
+	"""Drives env (reset on every episode end) for steps steps with a
+	neutral action and reports what that took. simulator_cpu +
+	client_cpu is the budget of one instance."""
+	action = np.zeros(env.action_space.shape)
+	env.reset()
+	meter = InstanceMeter(env)
+	for _ in range(steps):
+		_, _, done = env.step(action)
+		if done:
+			env.reset()
+	return meter.report()
+
+
+if __name__ == "__main__":
+	import argparse
+	parser = argparse.ArgumentParser(description='Plan simulator instances for this host.')
+	parser.add_argument('--budget', type=float, default=None, help='cores one simulator and its client use')
+	parser.add_argument('--reserve', type=int, default=0, help='cores to leave to the learner')
+	parser.add_argument('--measure', type=int, default=0, metavar='STEPS',
+						help='measure the budget over STEPS steps of one instance first')
+	parser.add_argument('--stand-in', action='store_true', help='measure scripts/scr_server.py instead of TORCS')
+	parser.add_argument('--port', type=int, default=3101)
+	args = parser.parse_args()
+	del sys.argv[1:]  # snakeoil3's Client parses the command line too.
+	budget = args.budget
+	if args.measure:
+		from environment import Environment
+		from scripts.process_manager import TorcsProcess, stand_in_args
+		process = TorcsProcess(args.port, args=stand_in_args if args.stand_in else None)
+		env = Environment(process=process)
+		try:
+			row = measure_budget(env, args.measure)
+		finally:
+			env.close()
+		print(format_report(row))
+		budget = row['simulator_cpu'] + row['client_cpu']
+	scheduler = HostScheduler(budget, reserve=args.reserve)
+	print("%d cores, %g per instance: %d instances" % (len(scheduler.cores), scheduler.budget, scheduler.capacity()))
+	for i in range(scheduler.capacity()):
+		print("  %d: simulator on %s, client on %s" % (i, sorted(scheduler.simulator_cores(i)), sorted(scheduler.client_cores(i))))
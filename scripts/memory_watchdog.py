@@ -0,0 +1,141 @@
+"""Relaunching the leaking simulator when its memory says so.
+
+TORCS leaks memory over a session, so the training loops relaunched it
+every third episode, throwing away its warm-up every time. A
+MemoryWatchdog samples the simulator's resident memory from /proc and
+only asks for a relaunch past a limit or a growth rate:
+
+	watchdog = MemoryWatchdog(limit_mb=1024)
+	ob = env.reset(relaunch=watchdog.check())   # Where it was relaunch=True
+
+Environment(watchdog=...) does that by itself. The gym_torcs loops,
+Deep-RL-TORCS-master/ddpg.py and samples/example_experiment.py, import
+it straight from scripts/, on Python 2 as well, so it only needs the
+standard library.
+"""
+from __future__ import division, print_function
+import os
+import sys
+import time
+
+monotonic = getattr(time, 'monotonic', time.time)  # Python 2 has no monotonic clock.
+
+
+def group_pids(pgid):
+	return [pid for pid in list_pids() if pgid_of(pid) == pgid]
+
+
+def group_rss(pgid):
+	"""Resident memory in bytes of every process in process group pgid."""
+	return sum([rss(pid) for pid in group_pids(pgid)])
+
+
+def named_rss(prefix='torcs'):
+	"""Resident memory in bytes of every process whose name starts with
+	prefix, for simulators started by TorcsInstance."""
+	total = 0
+	for pid in list_pids():
+		try:
+			with open('/proc/%d/comm' % pid) as f:
+				if f.read().startswith(prefix):
+					total += rss(pid)
+		except (IOError, OSError):
+			pass
+	return total
+
+
+def list_pids():
+	return [int(name) for name in os.listdir('/proc') if name.isdigit()]
+
+
+def pgid_of(pid):
+	try:
+		with open('/proc/%d/stat' % pid) as f:
+			# The name may hold spaces and parentheses, fields follow the last ')'.
+			return int(f.read().rsplit(')', 1)[1].split()[2])
+	except (IOError, OSError, IndexError, ValueError):
+		return None
+
+
+def rss(pid):
+	try:
+		with open('/proc/%d/status' % pid) as f:
+			for line in f:
+				if line.startswith('VmRSS:'):
+					return int(line.split()[1]) * 1024
+	except (IOError, OSError):
+		pass
+	return 0
+
+
+class MemoryWatchdog:
+	"""Decides when the leaking simulator really needs a relaunch.
+
+	Training loops used to relaunch TORCS every few episodes whatever its
+	memory use. Ask check() instead at those points: it samples the
+	simulator's resident memory (from /proc) and says relaunch only once
+	it is over limit_mb, or grew faster than growth_mb_per_min over the
+	last window seconds. Call sample() more often, e.g. every reset, for a
+	better growth estimate. Every relaunch and every relaunch avoided is
+	counted and logged.
+
+	process is the TorcsProcess to watch. Without one every process
+	named torcs* is, which is what TorcsInstance and gym_torcs start.
+	"""
+
+	def __init__(self, process=None, limit_mb=1024., growth_mb_per_min=None, window=300., out=sys.stdout):
+		self.process = process
+		self.limit = limit_mb * 2 ** 20
+		self.growth = growth_mb_per_min * 2 ** 20 / 60. if growth_mb_per_min else None
+		self.window = window
+		self.out = out
+		self.samples = []  # (time, bytes)
+		self.relaunches = 0
+		self.avoided = 0
+
+	def rss(self):
+		if self.process is not None:
+			if not self.process.running():
+				return 0
+			return group_rss(self.process.process.pid)
+		return named_rss()
+
+	def sample(self):
+		now = monotonic()
+		self.samples.append((now, self.rss()))
+		self.samples = [s for s in self.samples if s[0] >= now - self.window]
+		return self.samples[-1][1]
+
+	def growth_rate(self):
+		"""Bytes per second over the window, None before it spans a minute."""
+		(t0, m0), (t1, m1) = self.samples[0], self.samples[-1]
+		if t1 - t0 < 60.:
+			return None
+		return (m1 - m0) / (t1 - t0)
+
+	def reason(self):
+		"""Why a relaunch is due now, or None."""
+		current = self.sample()
+		if current > self.limit:
+			return 'RSS %.0f MB over %.0f MB' % (current / 2. ** 20, self.limit / 2. ** 20)
+		rate = self.growth_rate()
+		if self.growth and rate is not None and rate > self.growth:
+			return 'RSS growing %.1f MB/min' % (rate * 60. / 2 ** 20)
+		return None
+
+	def check(self):
+		"""True if the simulator should be relaunched now."""
+		reason = self.reason()
+		if reason is None:
+			self.avoided += 1
+			return False
+		self.relaunches += 1
+		print("Watchdog: relaunching, %s (%d relaunches, %d avoided)" % (reason, self.relaunches, self.avoided), file=self.out)
+		return True
+
+	def relaunched(self):
+		"""Starts over with the fresh process."""
+		self.samples = []
+
+	def summary(self):
+		return "Watchdog: %d relaunches, %d avoided" % (self.relaunches, self.avoided)
@@ -0,0 +1,292 @@
+"""Simulator processes we own, one Popen handle per instance.
+
+Unlike TorcsInstance, which starts TORCS through os.system, kills every
+torcs on the box with pkill and sleeps a fixed 2 seconds around both,
+a TorcsProcess starts one simulator in its own process group and stops
+only that group. It is ready as soon as its SCR port is bound, however
+long that takes. TORCS's scr_server binds it when the race starts, then
+waits for the client's init. The check only reads /proc/net/udp, since
+the real server identifies a single client per race and must not spend
+that on a probe.
+
+	manager = ProcessManager(4, first_port=3101, xvfb=True)
+	manager.start()              # All four launched at once, then waited for.
+	manager.restart(3103)        # Just that one.
+	manager.stop()
+
+MemoryWatchdog (scripts/memory_watchdog.py) watches an instance's
+memory, so that it is relaunched when it leaks too much rather than on a
+fixed schedule.
+
+args is the command line, where {port} and {display} are filled in per
+instance. TORCS picks its SCR port from the race configuration, so
+without one per instance several TORCS on one host would all want the
+same port (see race below). The SCR stand-in needs nothing of the sort:
+
+	ProcessManager(4, args=stand_in_args)
+
+TORCS picks its SCR port from the race it runs, so every instance races
+its own race (a race_config.RaceConfig, g-track-1 by default) with the
+instance's port in it. With vision=False TORCS starts straight into it
+headless (torcs -r), no menus involved. That race runs on the console
+and has no img sensor. With vision TORCS opens its window, on the
+instance's display, with a HOME of its own: a copy of ~/.torcs whose
+quick race is the instance's race. autostart.sh then walks the menus into
+that quick race, so instances never share a port or a config.
+
+time_scale runs the simulation that many times faster than real time.
+Programs taking {time_scale} on their command line, like the stand-in,
+get it there. Windowed TORCS gets Shift+plus key presses on its display
+once it is up (see time_scale.speed_up), so it must be a power of two. A
+headless race has no window for them and runs as fast as the client
+answers anyway.
+"""
+import copy
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from scripts.race_config import RaceConfig
+from scripts.time_scale import speed_up
+from scripts.memory_watchdog import MemoryWatchdog, group_pids, group_rss, list_pids, named_rss, pgid_of, rss
+
+# TORCS gets -vision too, or -r <race file> with vision=False.
+torcs_args = ['torcs', '-nofuel', '-nodamage', '-nolaptime']
+autostart = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'autostart.sh')
+stand_in_args = [sys.executable, '-m', 'scripts.scr_server', '--port', '{port}', '--time-scale', '{time_scale}']
+
+
+def udp_bound(port):
+	"""True if a UDP socket on this host is bound to port."""
+	for table in ['/proc/net/udp', '/proc/net/udp6']:
+		try:
+			with open(table) as f:
+				next(f)  # Column names.
+				for line in f:
+					local = line.split()[1]  # Address:port, in hex.
+					if int(local.rsplit(':', 1)[1], 16) == port:
+						return True
+		except (IOError, OSError):
+			pass
+	return False
+
+
+class TorcsProcess:
+	"""One simulator serving SCR on port.
+
+	With xvfb it gets a virtual X display of its own, numbered like its
+	port unless display says otherwise. Otherwise it runs on display, or
+	on the inherited DISPLAY when that is None too. With cores (a set of
+	CPU numbers) it runs on those only, see scripts/host_scheduler.py.
+	executable is the TORCS binary, when args is None.
+	"""
+
+	executable = torcs_args[0]
+
+	def __init__(self, port=3101, args=None, display=None, xvfb=False, timeout=30.,
+				 race=None, time_scale=1, cores=None, vision=True):
+		self.port = port
+		self.vision = vision
+		self.time_scale = time_scale
+		self.cores = cores
+		self.args = args  # None is TORCS.
+		if race is None and args is None:
+			race = RaceConfig()
+		self.race = copy.copy(race)  # A race_config.RaceConfig to race, on port.
+		if race is not None:
+			self.race.port = port
+		self.display = port if xvfb and display is None else display
+		self.xvfb = xvfb
+		self.timeout = timeout
+		self.process = None
+		self.xserver = None
+
+	def command(self):
+		if self.windowed():
+			args = [self.executable] + torcs_args[1:] + ['-vision']
+		elif self.args is None:
+			args = [self.executable] + torcs_args[1:] + ['-r', self.race.write()]
+		else:
+			args = self.args + (['-r', self.race.write()] if self.race is not None else [])
+		return [a.format(port=self.port, display=self.display, time_scale=self.time_scale) for a in args]
+
+	def windowed(self):
+		"""True for TORCS started into its menus, not into a race file."""
+		return self.args is None and self.vision
+
+	def home(self):
+		return os.path.join(tempfile.gettempdir(), 'torcs-%d' % self.port, 'home')
+
+	def prepare_home(self):
+		"""The instance's HOME: the user's ~/.torcs, copied once, with the
+		instance's race as the quick race the menus start."""
+		torcs = os.path.join(self.home(), '.torcs')
+		user = os.path.expanduser('~/.torcs')
+		if not os.path.isdir(torcs) and os.path.isdir(user):
+			shutil.copytree(user, torcs, symlinks=True)
+		self.race.write(os.path.join(torcs, 'config', 'raceman', 'quickrace.xml'))
+
+	def environ(self):
+		env = dict(os.environ)
+		if self.display is not None:
+			env['DISPLAY'] = ':%d' % self.display
+		if self.windowed():
+			# X still finds its cookie under the real HOME.
+			env.setdefault('XAUTHORITY', os.path.expanduser('~/.Xauthority'))
+			env['HOME'] = self.home()
+		return env
+
+	def launch(self):
+		"""Starts the process without waiting for it to be ready."""
+		if self.windowed():
+			self.prepare_home()
+		env = self.environ()
+		if self.xvfb and self.xserver is None:
+			self.xserver = subprocess.Popen(['Xvfb', ':%d' % self.display, '-screen', '0', '640x480x24'],
+											stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+											start_new_session=True)
+		self.process = subprocess.Popen(self.command(), env=env, start_new_session=True)
+
+	def wait_ready(self):
+		"""Waits until the server's port is bound, or raises RuntimeError if
+		the process dies or timeout seconds go by first."""
+		deadline = time.monotonic() + self.timeout
+		if self.windowed():
+			time.sleep(2.)  # For the window, then into the race.
+			subprocess.call(['sh', autostart], env=self.environ())
+		while not udp_bound(self.port):
+			time.sleep(0.05)
+			if self.process.poll() is not None:
+				raise RuntimeError('%s exited with %d' % (self.command()[0], self.process.returncode))
+			if time.monotonic() > deadline:
+				raise RuntimeError('no SCR server on port %d after %.0fs' % (self.port, self.timeout))
+		if self.cores:
+			# Up, so every process and thread of it exists by now.
+			for process in [self.process, self.xserver]:
+				if process is not None:
+					pin_group(process.pid, self.cores)
+		if self.time_scale != 1 and self.windowed():
+			speed_up(self.time_scale, self.display)
+		return self
+
+	def start(self):
+		self.launch()
+		return self.wait_ready()
+
+	def running(self):
+		return self.process is not None and self.process.poll() is None
+
+	def stop(self):
+		"""Stops this instance, and its Xvfb, and nothing else."""
+		for name in ['process', 'xserver']:
+			process = getattr(self, name)
+			if process is None:
+				continue
+			if process.poll() is None:
+				os.killpg(process.pid, signal.SIGTERM)
+				try:
+					process.wait(5.)
+				except subprocess.TimeoutExpired:
+					os.killpg(process.pid, signal.SIGKILL)
+					process.wait()
+			setattr(self, name, None)
+
+	def restart(self):
+		self.stop()
+		return self.start()
+
+
+class ProcessManager:
+	"""count TorcsProcesses on ports first_port, first_port + 1, ...
+	Other keyword arguments go to every TorcsProcess. With a
+	host_scheduler.HostScheduler each one is pinned to its own cores, and
+	count may not exceed what the scheduler says the host takes."""
+
+	def __init__(self, count, first_port=3101, scheduler=None, **kwargs):
+		if scheduler is not None:
+			scheduler.check(count)
+		self.instances = [TorcsProcess(first_port + i, **kwargs) for i in range(count)]
+		if scheduler is not None:
+			for i, instance in enumerate(self.instances):
+				instance.cores = scheduler.simulator_cores(i)
+
+	def __getitem__(self, port):
+		for instance in self.instances:
+			if instance.port == port:
+				return instance
+		raise KeyError(port)
+
+	def ports(self):
+		return [instance.port for instance in self.instances]
+
+	def start(self):
+		"""Launches every instance, then waits for all of them, so they
+		start up in parallel."""
+		for instance in self.instances:
+			instance.launch()
+		for instance in self.instances:
+			instance.wait_ready()
+		return self
+
+	def restart(self, port):
+		return self[port].restart()
+
+	def stop(self):
+		for instance in self.instances:
+			instance.stop()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *exc):
+		self.stop()
+
+
+def group_cpu_seconds(pgid):
+	"""CPU time, user and system, the processes in group pgid used so far."""
+	return sum([cpu_seconds(pid) for pid in group_pids(pgid)])
+
+
+def pin_group(pgid, cores):
+	"""Restricts every thread of every process in group pgid to cores.
+	Processes they start later inherit that."""
+	for pid in group_pids(pgid):
+		try:
+			for tid in os.listdir('/proc/%d/task' % pid):
+				os.sched_setaffinity(int(tid), cores)
+		except OSError:  # Gone in the meantime.
+			pass
+
+
+def cpu_seconds(pid):
+	try:
+		with open('/proc/%d/stat' % pid) as f:
+			fields = f.read().rsplit(')', 1)[1].split()
+		return (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+	except (IOError, OSError, IndexError, ValueError):
+		return 0.
+
+
+if __name__ == "__main__":
+	import argparse
+	parser = argparse.ArgumentParser(description='Start simulators and wait until they are up.')
+	parser.add_argument('count', type=int, nargs='?', default=1)
+	parser.add_argument('--port', type=int, default=3101, help='first port')
+	parser.add_argument('--xvfb', action='store_true', help='one virtual display per instance')
+	parser.add_argument('--stand-in', action='store_true', help='run scripts/scr_server.py instead of TORCS')
+	parser.add_argument('--time-scale', type=int, default=1, help='simulated seconds per second, a power of two')
+	args = parser.parse_args()
+	started = time.monotonic()
+	manager = ProcessManager(args.count, first_port=args.port, xvfb=args.xvfb, time_scale=args.time_scale,
+							 args=stand_in_args if args.stand_in else None)
+	manager.start()
+	print("%d up on ports %s in %.2fs, Ctrl-C stops them" % (args.count, manager.ports(), time.monotonic() - started))
+	try:
+		while True:
+			time.sleep(1.)
+	except KeyboardInterrupt:
+		pass
+	manager.stop()
@@ -0,0 +1,130 @@
+"""Race configuration files, so TORCS starts straight into the race.
+
+The autostart scripts walk the TORCS menus with xte key presses. That
+needs an X session, takes a couple of seconds and misfires under load.
+TORCS can start a race from a configuration file instead
+(torcs -r race.xml), which is what RaceConfig writes:
+
+	race = RaceConfig(track='e-track-6', laps=3, port=3102)
+	path = race.write()                  # /tmp/torcs-3102/race.xml
+	args = race.args()                   # torcs ... -r /tmp/torcs-3102/race.xml
+
+torcs -r runs the race on the console, without a window. That suits
+sensor-only runs, but stock TORCS then renders nothing for the -vision
+img sensor, so vision runs still start through the menus.
+
+The SCR port is where the server robot listens: scr_server robot idx
+listens on base_port + idx, 3101 onwards for the vision patched TORCS.
+"""
+import os
+import random
+import tempfile
+
+# Tracks of a stock TORCS install, by category.
+tracks = {'road': ['g-track-1', 'g-track-2', 'g-track-3', 'e-track-1', 'e-track-2', 'e-track-3',
+				   'e-track-4', 'e-track-6', 'alpine-1', 'alpine-2', 'aalborg', 'brondehach',
+				   'corkscrew', 'forza', 'ole-road-1', 'ruudskogen', 'spring', 'street-1',
+				   'wheel-1', 'wheel-2'],
+		  'oval': ['a-speedway', 'b-speedway', 'c-speedway', 'd-speedway', 'e-speedway',
+				   'f-speedway', 'g-speedway', 'michigan'],
+		  'dirt': ['dirt-1', 'dirt-2', 'dirt-3', 'dirt-4', 'dirt-5', 'dirt-6', 'mixed-1', 'mixed-2']}
+
+base_port = 3101
+
+template = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE params SYSTEM "params.dtd">
+<params name="Quick Race">
+  <section name="Header">
+    <attstr name="name" val="Quick Race"/>
+    <attstr name="description" val="Quick Race"/>
+    <attnum name="priority" val="10"/>
+  </section>
+  <section name="Tracks">
+    <attnum name="maximum number" val="1"/>
+    <section name="1">
+      <attstr name="name" val="%(track)s"/>
+      <attstr name="category" val="%(category)s"/>
+    </section>
+  </section>
+  <section name="Races">
+    <section name="1">
+      <attstr name="name" val="Quick Race"/>
+    </section>
+  </section>
+  <section name="Quick Race">
+    <attnum name="distance" unit="km" val="0"/>
+    <attstr name="type" val="race"/>
+    <attstr name="starting order" val="drivers list"/>
+    <attstr name="restart" val="yes"/>
+    <attnum name="laps" val="%(laps)d"/>
+    <section name="Starting Grid">
+      <attnum name="rows" val="2"/>
+      <attnum name="distance to start" val="25"/>
+      <attnum name="distance between columns" val="20"/>
+      <attnum name="offset within a column" val="10"/>
+      <attnum name="initial speed" val="0"/>
+      <attnum name="initial height" val="1"/>
+    </section>
+  </section>
+  <section name="Drivers">
+    <attnum name="maximum number" val="40"/>
+    <attnum name="focused idx" val="%(idx)d"/>
+    <attstr name="focused module" val="scr_server"/>
+    <section name="1">
+      <attnum name="idx" val="%(idx)d"/>
+      <attstr name="module" val="scr_server"/>
+%(car)s    </section>
+  </section>
+</params>
+"""
+
+
+class RaceConfig:
+	"""A single-driver quick race for the scr_server robot serving on port."""
+
+	def __init__(self, track='g-track-1', category=None, laps=1, port=base_port, car=None, directory=None):
+		self.track = track
+		self.category = category or self.category_of(track)
+		self.laps = laps
+		self.port = port
+		self.car = car
+		self.directory = directory
+
+	@staticmethod
+	def category_of(track):
+		for category, names in tracks.items():
+			if track in names:
+				return category
+		return 'road'
+
+	@classmethod
+	def random(cls, category='road', **kwargs):
+		"""A race on a random track of category, what random_autostart.sh did."""
+		return cls(track=random.choice(tracks[category]), category=category, **kwargs)
+
+	def idx(self):
+		if not 0 <= self.port - base_port < 10:
+			raise ValueError('scr_server listens on ports %d to %d, not %d' % (base_port, base_port + 9, self.port))
+		return self.port - base_port
+
+	def xml(self):
+		car = '      <attstr name="car name" val="%s"/>\n' % self.car if self.car else ''
+		return template % {'track': self.track, 'category': self.category, 'laps': self.laps,
+						   'idx': self.idx(), 'car': car}
+
+	def path(self):
+		directory = self.directory or os.path.join(tempfile.gettempdir(), 'torcs-%d' % self.port)
+		return os.path.join(directory, 'race.xml')
+
+	def write(self, path=None):
+		"""Saves the race to path, by default path(), and returns where."""
+		path = path or self.path()
+		if not os.path.isdir(os.path.dirname(path)):
+			os.makedirs(os.path.dirname(path))
+		with open(path, 'w') as f:
+			f.write(self.xml())
+		return path
+
+	def args(self, torcs='torcs', vision=False):
+		"""Writes the file and returns the command line racing on it."""
+		return [torcs, '-nofuel', '-nodamage', '-nolaptime'] + (['-vision'] if vision else []) + ['-r', self.write()]
@@ -0,0 +1,326 @@
+"""A local stand-in for a vision-patched TORCS speaking the SCR protocol.
+
+It answers the init handshake with ***identified***, streams sensor
+strings (including the 64x64x3 img field) from a simple kinematic car
+model, restarts on meta and ends the race with ***shutdown***. Step rate,
+latency and packet loss are configurable, so the client, the Environment
+and the data collector can be benchmarked and soak-tested on machines
+without TORCS or an X session.
+
+Run from the repository root:
+	python -m scripts.scr_server --port 3101 --rate 50 --loss 0.01
+or in-process:
+	server = StandInServer(port=3101, rate=0)
+	server.start()
+	...
+	server.stop()
+"""
+import argparse
+import heapq
+import math
+import random
+import select
+import socket
+import threading
+import time
+import numpy as np
+import snakeoil3_gym as snakeoil3
+
+# Same default as the client, in case the init message carries none.
+default_angles = [-45, -19, -12, -7, -4, -2.5, -1.7, -1, -.5, 0, .5, 1, 1.7, 2.5, 4, 7, 12, 19, 45]
+pixel_strings = [str(i) for i in range(256)]
+
+
+class KinematicCar:
+	"""A bicycle model on an oval: two straights joined by half circles.
+
+	Positions follow the server's conventions: trackPos is +1 on the left
+	edge and -1 on the right one, angle is the track direction minus the
+	car's heading and steer > 0 turns left.
+	"""
+
+	def __init__(self, straight=600., radius=130., width=12., angles=None):
+		self.straight = straight
+		self.radius = radius
+		self.half_width = width / 2.
+		self.length = 2 * straight + 2 * math.pi * radius
+		self.set_angles(angles or default_angles)
+		self.reset()
+
+	def set_angles(self, angles):
+		self.angles = np.radians(np.array(angles, dtype=np.float64))
+
+	def reset(self):
+		self.s = 0.  # Distance from start along the centre line.
+		self.y = 0.  # Lateral offset, metres to the left.
+		self.heading = 0.  # Car heading relative to the track, left positive.
+		self.v = 0.  # m/s
+		self.gear = 0
+		self.dist_raced = 0.
+		self.lap_time = 0.
+		self.last_lap_time = 0.
+		self.laps = 0
+
+	def curvature(self):
+		"""1/radius in the bends (they all turn left), 0 on the straights."""
+		s = self.s % self.length
+		bend = math.pi * self.radius
+		if s < self.straight or self.straight + bend <= s < 2 * self.straight + bend:
+			return 0.
+		return 1. / self.radius
+
+	def step(self, action, dt):
+		accel = snakeoil3.clip(action.get('accel', 0.), 0, 1)
+		brake = snakeoil3.clip(action.get('brake', 0.), 0, 1)
+		steer = snakeoil3.clip(action.get('steer', 0.), -1, 1)
+		self.gear = int(action.get('gear', 1))
+		off_track = abs(self.y) > self.half_width
+		drag = 0.0004 * self.v * self.v + (3. if off_track else 0.)
+		force = (10. * accel if self.gear > 0 else 0.) - 30. * brake - drag
+		self.v = max(0., self.v + force * dt)
+		ds = self.v * math.cos(self.heading) * dt
+		yaw_rate = self.v * math.tan(steer * 0.366) / 2.5  # 21 degree lock, 2.5 m wheelbase.
+		self.heading += (yaw_rate - self.curvature() * ds / dt) * dt
+		self.heading = (self.heading + math.pi) % (2 * math.pi) - math.pi
+		self.y += self.v * math.sin(self.heading) * dt
+		self.s += ds
+		self.dist_raced += ds
+		self.lap_time += dt
+		if self.s >= self.length:
+			self.s -= self.length
+			self.laps += 1
+			self.last_lap_time = self.lap_time
+			self.lap_time = 0.
+
+	def track_sensors(self):
+		"""Ray distances to the track edges, treating the track as locally
+		straight. -1 everywhere once off the track, as the server does."""
+		if abs(self.y) > self.half_width:
+			return -np.ones(self.angles.size)
+		theta = self.heading - self.angles
+		sin = np.sin(theta)
+		with np.errstate(divide='ignore'):
+			left = (self.half_width - self.y) / sin
+			right = (self.half_width + self.y) / -sin
+		dist = np.where(sin > 0, left, right)
+		dist[np.abs(sin) < 1e-6] = 200.
+		return np.clip(dist, 0., 200.)
+
+	def sensors(self):
+		speed = self.v * 3.6
+		gear_ratio = [0., 3.9, 2.9, 2.3, 1.87, 1.68, 1.54][max(0, min(self.gear, 6))]
+		return {'angle': -self.heading,
+				'curLapTime': self.lap_time,
+				'damage': 0,
+				'distFromStart': self.s,
+				'distRaced': self.dist_raced,
+				'fuel': 94,
+				'gear': self.gear,
+				'lastLapTime': self.last_lap_time,
+				'opponents': [200] * 36,
+				'racePos': 1,
+				'rpm': max(942., self.v / 0.3 * gear_ratio * 9.55 * 4.5),
+				'speedX': speed * math.cos(self.heading),
+				'speedY': speed * math.sin(self.heading),
+				'speedZ': 0,
+				'track': self.track_sensors(),
+				'trackPos': self.y / self.half_width,
+				'wheelSpinVel': [self.v / 0.3] * 4,
+				'z': 0.345,
+				'focus': [-1] * 5}
+
+	def image(self):
+		"""A 64x64 RGB frame: sky above, grey road below whose edges move
+		with the car's position and heading."""
+		img = np.empty((64, 64, 3), dtype=np.uint8)
+		img[:32] = (135, 170, 220)
+		img[32:] = (70, 120, 50)
+		rows = np.arange(32)[:, None]
+		cols = np.arange(64)[None, :]
+		centre = 32 + 40 * self.y / self.half_width * (rows + 1) / 32. - 30 * self.heading
+		half = 2 + rows
+		road = np.abs(cols - centre) < half
+		img[32:][road] = (110, 110, 110)
+		return img
+
+
+class StandInServer:
+	"""Serves one KinematicCar over UDP like a TORCS SCR server.
+
+	rate is the number of simulation steps per wall-clock second, 0 means
+	lockstep: every client reply advances the simulation right away (and a
+	lost reply advances it after timeout). latency delays every datagram
+	sent to the client by that many seconds, loss drops each of them with
+	that probability. The race ends after laps laps or max_steps steps.
+	time_scale multiplies rate like speeding up TORCS does: every step is
+	still dt simulated seconds, there are just more of them per second.
+	"""
+
+	def __init__(self, host='localhost', port=3001, rate=50., latency=0., loss=0.,
+				 vision=True, laps=1, max_steps=0, dt=0.02, timeout=0.01, seed=None, time_scale=1.):
+		self.host = host
+		self.port = port
+		self.rate = rate
+		self.time_scale = time_scale
+		self.latency = latency
+		self.loss = loss
+		self.vision = vision
+		self.laps = laps
+		self.max_steps = max_steps
+		self.dt = dt
+		self.timeout = timeout
+		self.random = random.Random(seed)
+		self.car = KinematicCar()
+		self.action = {}
+		self.client = None  # Address of the identified client.
+		self.steps = 0
+		self.sent = 0
+		self.dropped = 0
+		self.received = 0
+		self.restarts = 0
+		self.image_cache = {}
+		self.outbox = []  # Heap of (due time, sequence, data, address).
+		self.so = None
+		self.thread = None
+		self.running = False
+
+	def bind(self):
+		self.so = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.so.bind((self.host, self.port))
+		self.port = self.so.getsockname()[1]  # In case port 0 was asked for.
+
+	def start(self):
+		"""Serves from a daemon thread."""
+		if self.so is None:
+			self.bind()
+		self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.running = False
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+		if self.so is not None:
+			self.so.close()
+			self.so = None
+
+	def serve_forever(self):
+		if self.so is None:
+			self.bind()
+		self.running = True
+		next_tick = None
+		while self.running:
+			now = time.monotonic()
+			due = [0.1]
+			if next_tick is not None:
+				due.append(next_tick - now)
+			if self.outbox:
+				due.append(self.outbox[0][0] - now)
+			readable, _, _ = select.select([self.so], [], [], max(0., min(due)))
+			if readable:
+				data, addr = self.so.recvfrom(snakeoil3.data_size)
+				if self.handle(data, addr) and self.client is not None and not self.rate:
+					next_tick = time.monotonic()  # Lockstep: the reply is in, step now.
+				if self.client is not None and next_tick is None:
+					next_tick = time.monotonic()
+			now = time.monotonic()
+			while self.outbox and self.outbox[0][0] <= now:
+				_, _, data, addr = heapq.heappop(self.outbox)
+				self.so.sendto(data, addr)
+			if self.client is None:
+				next_tick = None
+			elif next_tick is not None and next_tick <= now:
+				self.tick()
+				if self.rate:
+					next_tick = max(next_tick + 1. / (self.rate * self.time_scale), now)
+				else:
+					next_tick = now + self.timeout
+
+	def handle(self, data, addr):
+		"""Deals with one datagram from a client. True if it was an action."""
+		self.received += 1
+		if b'(init' in data:
+			angles = data[data.find(b'(init') + 5:data.rfind(b')')].split()
+			if len(angles) == 19:
+				self.car.set_angles([float(a) for a in angles])
+			self.car.reset()
+			self.action = {}
+			self.steps = 0
+			self.client = addr
+			self.send(b'***identified***', addr, reliable=True)
+			return False
+		if addr != self.client:
+			return False
+		action = snakeoil3.parse_driver_action(data)
+		self.action = action
+		if action.get('meta'):
+			# Race restart, the client comes back with a new init.
+			self.restarts += 1
+			self.send(b'***restart***', addr, reliable=True)
+			self.client = None
+			self.car.reset()
+			return False
+		return True
+
+	def tick(self):
+		"""Advances the car one simulation step and reports on it."""
+		self.car.step(self.action, self.dt)
+		self.steps += 1
+		if self.car.laps >= self.laps or (self.max_steps and self.steps >= self.max_steps):
+			self.send(b'***shutdown***', self.client, reliable=True)
+			self.client = None
+			return
+		self.send(self.compose().encode(), self.client)
+
+	def compose(self):
+		sensors = self.car.sensors()
+		if self.vision:
+			sensors['img'] = self.image_string()
+		return snakeoil3.compose_server_str(sensors)
+
+	def image_string(self):
+		"""The img field, cached on the (rounded) car pose since formatting
+		12288 numbers costs far more than drawing them."""
+		key = (round(self.car.y, 1), round(self.car.heading, 2))
+		if key not in self.image_cache:
+			if len(self.image_cache) > 4096:
+				self.image_cache.clear()
+			pixels = self.car.image().reshape(-1).tolist()
+			self.image_cache[key] = ' '.join([pixel_strings[p] for p in pixels])
+		return self.image_cache[key]
+
+	def send(self, data, addr, reliable=False):
+		if not reliable and self.loss and self.random.random() < self.loss:
+			self.dropped += 1
+			return
+		self.sent += 1
+		if self.latency:
+			heapq.heappush(self.outbox, (time.monotonic() + self.latency, self.sent, data, addr))
+		else:
+			self.so.sendto(data, addr)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='SCR protocol stand-in for TORCS.')
+	parser.add_argument('--host', default='localhost')
+	parser.add_argument('--port', type=int, default=3001)
+	parser.add_argument('--rate', type=float, default=50., help='steps per second, 0 for lockstep')
+	parser.add_argument('--time-scale', type=float, default=1., help='multiplies rate, like speeding up TORCS')
+	parser.add_argument('--latency', type=float, default=0., help='seconds added to every reply')
+	parser.add_argument('--loss', type=float, default=0., help='probability of dropping a sensor datagram')
+	parser.add_argument('--laps', type=int, default=1)
+	parser.add_argument('--max-steps', type=int, default=0)
+	parser.add_argument('--novision', action='store_true', help='do not send the img field')
+	parser.add_argument('--seed', type=int, default=None)
+	args = parser.parse_args()
+	server = StandInServer(host=args.host, port=args.port, rate=args.rate, latency=args.latency,
+						   loss=args.loss, vision=not args.novision, laps=args.laps,
+						   max_steps=args.max_steps, seed=args.seed, time_scale=args.time_scale)
+	print("SCR stand-in listening on %s:%d" % (args.host, args.port))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	print("Steps %d, sent %d, dropped %d, restarts %d" % (server.steps, server.sent, server.dropped, server.restarts))
@@ -0,0 +1,32 @@
+"""Running TORCS faster than real time.
+
+TORCS has no command-line option for its speed. In a race, Shift+plus
+doubles it, which is what makeitfast.sh presses twice for 4 times real
+time. speed_up() presses it as often as a time_scale asks for.
+
+Kept to the standard library, so the Python 2 ddpg.py can speed up the
+races it relaunches too.
+"""
+import math
+import os
+import subprocess
+
+
+def time_scale_presses(time_scale):
+	"""Shift+plus presses that take TORCS from real time to time_scale.
+	Each one doubles the simulation speed, so only powers of two work."""
+	presses = int(round(math.log(time_scale, 2))) if time_scale >= 1 else -1
+	if presses < 0 or 2 ** presses != time_scale:
+		raise ValueError('TORCS runs at 1, 2, 4, 8... times real time, not %r' % (time_scale,))
+	return presses
+
+
+def speed_up(time_scale, display=None):
+	"""Makes the TORCS race on display (the inherited DISPLAY if None) run
+	at time_scale times real time, what makeitfast.sh does for 4. TORCS
+	must be in the race already, e.g. once a client is connected."""
+	env = dict(os.environ)
+	if display is not None:
+		env['DISPLAY'] = ':%d' % display
+	for _ in range(time_scale_presses(time_scale)):
+		subprocess.call(['xte', 'usleep 100000', 'keydown Shift_L', 'key plus', 'keyup Shift_L'], env=env)
@@ -0,0 +1,131 @@
+"""Binary logs of raw SCR sessions, for record and replay.
+
+A log is a short magic header followed by one record per datagram:
+a little-endian float64 monotonic timestamp, one direction byte
+(RECEIVED from the server or SENT to it), a uint32 length and then the
+datagram itself. Client(capture='race.scrlog') writes one. ReplayClient
+in snakeoil3_gym reads it back through the usual get_servers_input.
+
+To benchmark the client on a captured race, from the repository root:
+	python session_log.py race.scrlog [--realtime] [--parser record]
+"""
+import struct
+import time
+
+magic = b'SCRLOG1\n'
+header = struct.Struct('<dBI')
+RECEIVED = 0
+SENT = 1
+
+
+class SessionRecorder:
+    """Appends datagrams to a session log as they go by."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(magic)
+
+    def record(self, direction, data):
+        self.file.write(header.pack(time.monotonic(), direction, len(data)))
+        self.file.write(data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_session(path):
+    """Yields (timestamp, direction, datagram) for every record in a log."""
+    with open(path, 'rb') as file:
+        if file.read(len(magic)) != magic:
+            raise ValueError('%s is not a session log' % path)
+        while True:
+            head = file.read(header.size)
+            if len(head) < header.size:
+                return
+            timestamp, direction, length = header.unpack(head)
+            yield timestamp, direction, file.read(length)
+
+
+class ReplaySocket:
+    """Stands in for the client's UDP socket and hands out the received
+    datagrams of a log in order. With realtime they come at the pace they
+    were recorded at, otherwise as fast as they are asked for. Once the
+    log runs out the server 'shuts down' the race."""
+
+    def __init__(self, path, realtime=False):
+        self.datagrams = [(t, d) for t, direction, d in read_session(path) if direction == RECEIVED]
+        self.realtime = realtime
+        self.position = 0
+        self.sent = 0
+        self.start = None
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def gettimeout(self):
+        return self.timeout
+
+    def recvfrom(self, size):
+        if self.position >= len(self.datagrams):
+            if self.timeout == 0:
+                raise BlockingIOError()
+            return b'***shutdown***', None
+        timestamp, data = self.datagrams[self.position]
+        if self.timeout == 0:
+            # Only what would have arrived by now is queued, and at full
+            # speed nothing is: the replay runs in lockstep.
+            if not self.realtime or self.start is None or self.start + timestamp > time.monotonic():
+                raise BlockingIOError()
+        elif self.realtime:
+            if self.start is None:
+                self.start = time.monotonic() - timestamp
+            delay = self.start + timestamp - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.position += 1
+        return data[:size], None
+
+    def sendto(self, data, addr):
+        self.sent += 1
+        return len(data)
+
+    def close(self):
+        pass
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    sys.argv, args = sys.argv[:1], sys.argv[1:]  # The Client reads sys.argv.
+    import snakeoil3_gym as snakeoil3
+    parser = argparse.ArgumentParser(description='Replay a captured session through the client.')
+    parser.add_argument('log')
+    parser.add_argument('--realtime', action='store_true', help='keep the recorded timing')
+    parser.add_argument('--parser', default='dict', choices=['dict', 'record', 'lazy'])
+    parser.add_argument('--timing', action='store_true', help='print per-phase latencies')
+    parser.add_argument('--drain', action='store_true', help='always skip to the newest datagram')
+    args = parser.parse_args(args)
+    timers = None
+    if args.timing:
+        from step_timers import StepTimers
+        timers = StepTimers()
+    C = snakeoil3.ReplayClient(args.log, realtime=args.realtime, parser=args.parser, timers=timers, drain=args.drain)
+    steps = 0
+    start = time.perf_counter()
+    while True:
+        C.get_servers_input()
+        if not C.so:
+            break
+        C.respond_to_server()
+        steps += 1
+    elapsed = time.perf_counter() - start
+    print("%d steps in %.3fs, %.0f steps/s" % (steps, elapsed, steps / elapsed))
+    if args.drain:
+        print(C.drop_stats())
+    if timers:
+        timers.dump()
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# snakeoil3_async.py
+# An asyncio flavour of the snakeoil3_gym client. Every Client there owns
+# a blocking socket, so each car needs a process of its own. Here a
+# single event loop can drive dozens of TORCS servers (ports 3001..30NN)
+# at once. The objects are the same: S is a snakeoil3_gym.ServerState
+# and R a snakeoil3_gym.DriverAction, so drive functions written for the
+# blocking client work unchanged:
+#
+#    async def race(C):
+#        await C.setup_connection()
+#        for step in range(C.maxSteps,0,-1):
+#            await C.get_servers_input()
+#            snakeoil3.drive_example(C)
+#            C.respond_to_server()
+#        C.shutdown()
+#
+# which is what race() below does. To run ten cars from one process:
+#
+#    run_races([AsyncClient(p=port) for port in range(3001, 3011)])
+import asyncio
+import sys
+import snakeoil3_gym as snakeoil3
+
+class ClientProtocol(asyncio.DatagramProtocol):
+	'''Queues up everything the server sends, for get_servers_input.'''
+	def __init__(self):
+		self.transport= None
+		self.queue= asyncio.Queue()
+
+	def connection_made(self, transport):
+		self.transport= transport
+
+	def datagram_received(self, data, addr):
+		self.queue.put_nowait(data)
+
+	def error_received(self, exc):
+		# Usually ICMP port unreachable, the server is not up yet.
+		pass
+
+class AsyncClient():
+	def __init__(self,H='localhost',p=3001,i='SCR',s=3,d=False,vision=False,parser='dict',timeout=1.0,encoder=None):
+		self.vision= vision
+		self.host= H
+		self.port= p
+		self.sid= i
+		self.stage= s # 0=Warm-up, 1=Qualifying 2=Race, 3=unknown <Default=3>
+		self.debug= d
+		self.maxSteps= 100000  # 50steps/second
+		self.timeout= timeout
+		self.S= snakeoil3.make_server_state(parser)
+		self.R= snakeoil3.DriverAction()
+		self.encoder= encoder # A snakeoil3_gym.ActionEncoder, or None for repr(R).
+		self.so= None
+		self.protocol= None
+
+	async def setup_connection(self):
+		'''Opens the UDP endpoint and repeats the init message until the
+		server identifies us.'''
+		loop= asyncio.get_event_loop()
+		self.so,self.protocol= await loop.create_datagram_endpoint(
+			ClientProtocol, remote_addr=(self.host, self.port))
+		# Same track sensor angles as snakeoil3_gym.Client.
+		a= "-45 -19 -12 -7 -4 -2.5 -1.7 -1 -.5 0 .5 1 1.7 2.5 4 7 12 19 45"
+		initmsg='%s(init %s)' % (self.sid,a)
+		while True:
+			self.so.sendto(initmsg.encode())
+			try:
+				sockdata= await asyncio.wait_for(self.protocol.queue.get(), self.timeout)
+			except asyncio.TimeoutError:
+				print("Waiting for server on %d............" % self.port)
+				continue
+			if b'***identified***' in sockdata:
+				print("Client connected on %d.............." % self.port)
+				return
+
+	async def get_servers_input(self):
+		'''Server's input is stored in a ServerState object'''
+		if not self.so: return
+		while True:
+			try:
+				sockdata= await asyncio.wait_for(self.protocol.queue.get(), self.timeout)
+			except asyncio.TimeoutError:
+				print('.', end=' ')
+				continue
+			if b'***identified***' in sockdata:
+				print("Client connected on %d.............." % self.port)
+				continue
+			elif b'***shutdown***' in sockdata:
+				print((("Server has stopped the race on %d. "+
+						"You were in %d place.") %
+						(self.port,self.S.d['racePos'])))
+				self.shutdown()
+				return
+			elif b'***restart***' in sockdata:
+				print("Server has restarted the race on %d." % self.port)
+				self.shutdown()
+				return
+			elif not sockdata: # Empty?
+				continue       # Try again.
+			else:
+				self.S.parse_server_bytes(sockdata)
+				if self.debug:
+					print(self.S)
+				return
+
+	def respond_to_server(self):
+		'''Sending a datagram never blocks, so this is not a coroutine.'''
+		if not self.so: return
+		if self.encoder:
+			self.so.sendto(self.encoder.encode_action(self.R))
+		else:
+			self.so.sendto(repr(self.R).encode())
+		if self.debug: print(self.R.fancyout())
+
+	def shutdown(self):
+		if not self.so: return
+		print(("Race terminated or %d steps elapsed. Shutting down %d."
+			   % (self.maxSteps,self.port)))
+		self.so.close()
+		self.so= None
+
+async def race(C, drive=snakeoil3.drive_example):
+	'''Connects one client and drives it until the race ends.'''
+	await C.setup_connection()
+	for step in range(C.maxSteps,0,-1):
+		await C.get_servers_input()
+		if not C.so: break
+		drive(C)
+		C.respond_to_server()
+	C.shutdown()
+
+async def races(clients, drive=snakeoil3.drive_example):
+	'''Drives all clients concurrently until every race is over.'''
+	await asyncio.gather(*[race(C, drive) for C in clients])
+
+def run_races(clients, drive=snakeoil3.drive_example):
+	'''Runs races() on a fresh event loop.'''
+	loop= asyncio.new_event_loop()
+	try:
+		loop.run_until_complete(races(clients, drive))
+	finally:
+		loop.close()
+
+# ================ MAIN ================
+if __name__ == "__main__":
+	# snakeoil3_async.py <first port> <number of servers>
+	first= int(sys.argv[1]) if len(sys.argv) > 1 else 3001
+	count= int(sys.argv[2]) if len(sys.argv) > 2 else 1
+	run_races([AsyncClient(p=port) for port in range(first, first + count)])
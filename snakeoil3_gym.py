@@ -56,12 +56,43 @@
 import socket
 import sys
 import getopt
-import os
 import time
+import re
+import threading
+import numpy as np
+import session_log
 PI= 3.14159265359
 
 data_size = 2**17
 
+# Fixed layout of the sensors the server reports, see the SCR manual.
+# The record parser (Client(parser='record')) fills one preallocated
+# structured array with this layout instead of building a new dict of
+# float lists on every step. Everything is float32 so the record can
+# also be seen as one flat vector.
+sensor_layout= [
+	('angle', np.float32),
+	('curLapTime', np.float32),
+	('damage', np.float32),
+	('distFromStart', np.float32),
+	('distRaced', np.float32),
+	('fuel', np.float32),
+	('gear', np.float32),
+	('lastLapTime', np.float32),
+	('opponents', np.float32, (36,)),
+	('racePos', np.float32),
+	('rpm', np.float32),
+	('speedX', np.float32),
+	('speedY', np.float32),
+	('speedZ', np.float32),
+	('track', np.float32, (19,)),
+	('trackPos', np.float32),
+	('wheelSpinVel', np.float32, (4,)),
+	('z', np.float32),
+	('focus', np.float32, (5,)),
+	]
+server_state_dtype= np.dtype(sensor_layout)
+
 # Initialize help messages
 ophelp=  'Options:\n'
 ophelp+= ' --host, -H <host>    TORCS server host. [localhost]\n'
@@ -116,7 +147,21 @@ def bargraph(x,mn,mx,w,c='X'):
 	return '[%s]' % (nnc+npc+ppc+pnc)
 
 class Client():
-	def __init__(self,H=None,p=None,i=None,e=None,t=None,s=None,d=None,vision=False):
+	capture= None # A session_log.SessionRecorder when capturing.
+	timers= None # A step_timers.StepTimers when timing the loop.
+	received_at= None # When the last sensor datagram was parsed.
+	sent_at= None # When the last reply went out.
+	drain= False # Skip to the newest queued datagram, see drain_socket.
+	encoder= None # An ActionEncoder to build replies with, instead of repr(R).
+	telemetry= None # The TelemetryRenderer drawing --debug output.
+	telemetry_rate= 5. # Times a second the debug telemetry is redrawn.
+	relaunch= True # pkill and restart TORCS when the server stops answering.
+	steps= 0 # Sensor datagrams used this race.
+	skipped= 0 # Older ones thrown away by drain_socket.
+	stale_steps= 0 # Steps which had to skip some.
+	max_skipped= 0 # Most skipped in a single step.
+
+	def __init__(self,H=None,p=None,i=None,e=None,t=None,s=None,d=None,vision=False,parser='dict',capture=None,timers=None,drain=False,encoder=None,telemetry_rate=None,sensors_only=False,relaunch=None):
 		# If you don't like the option defaults,  change them here.
 		self.vision = vision
 
@@ -136,8 +181,20 @@ class Client():
 		if t: self.trackname= t
 		if s: self.stage= s
 		if d: self.debug= d
-		self.S= ServerState()
+		self.S= make_server_state(parser)
+		# Never decode img, even if the server sends it.
+		if sensors_only: self.S.skip_img= True
 		self.R= DriverAction()
+		# Log every datagram to this file, for ReplayClient.
+		if capture: self.capture= session_log.SessionRecorder(capture)
+		# Per-phase latency histograms, see step_timers.
+		if timers: self.timers= timers
+		# Always act on the freshest state when the policy is slow.
+		if drain: self.drain= drain
+		if encoder: self.encoder= encoder
+		if telemetry_rate: self.telemetry_rate= telemetry_rate
+		# Off when something else owns the simulator (or it is the stand-in).
+		if relaunch is not None: self.relaunch= relaunch
 		self.setup_connection()
 
 	def setup_connection(self):
@@ -161,26 +218,21 @@ class Client():
 
 			try:
 				self.so.sendto(initmsg.encode(), (self.host, self.port))
+				if self.capture: self.capture.record(session_log.SENT, initmsg.encode())
 			except socket.error as emsg:
 				sys.exit(-1)
 			sockdata= str()
 			try:
 				sockdata,addr= self.so.recvfrom(data_size)
+				if self.capture: self.capture.record(session_log.RECEIVED, sockdata)
 				sockdata = sockdata.decode('utf-8')
 			except socket.error as emsg:
 				print("Waiting for server on %d............" % self.port)
 				print("Count Down : " + str(n_fail))
-				if n_fail < 0:
+				if n_fail < 0 and self.relaunch:
 					print("relaunch torcs")
-					os.system('pkill torcs')
-					time.sleep(1.5)
-					if self.vision is False:
-						os.system('torcs -nofuel -nodamage -nolaptime &')
-					else:
-						os.system('torcs -nofuel -nodamage -nolaptime -vision &')
-					time.sleep(1.5)
-					os.system('sh scripts/autostart.sh')
-					time.sleep(1.5)
+					from scripts.autostart import TorcsInstance
+					TorcsInstance(vision=self.vision).start()
 					n_fail = 5
 				n_fail -= 1
 
@@ -233,26 +285,30 @@ class Client():
 	def get_servers_input(self):
 		'''Server's input is stored in a ServerState object'''
 		if not self.so: return
-		sockdata= str()
+		sockdata= bytes()
+		timers= self.timers
+		if timers: started= time.perf_counter()
 
 		while True:
 			try:
-				# Receive server data
+				# Receive server data, left as bytes for the parser.
 				sockdata,addr= self.so.recvfrom(data_size)
-				sockdata = sockdata.decode('utf-8')
+				if self.capture: self.capture.record(session_log.RECEIVED, sockdata)
+				if self.drain: sockdata= self.drain_socket(sockdata)
+				if timers: received= time.perf_counter()
 			except socket.error as emsg:
 				print('.', end=' ')
 				#print "Waiting for data on %d.............." % self.port
-			if '***identified***' in sockdata:
+			if b'***identified***' in sockdata:
 				print("Client connected on %d.............." % self.port)
 				continue
-			elif '***shutdown***' in sockdata:
+			elif b'***shutdown***' in sockdata:
 				print((("Server has stopped the race on %d. "+
 						"You were in %d place.") %
 						(self.port,self.S.d['racePos'])))
 				self.shutdown()
 				return
-			elif '***restart***' in sockdata:
+			elif b'***restart***' in sockdata:
 				# What do I do here?
 				print("Server has restarted the race on %d." % self.port)
 				# I haven't actually caught the server doing this.
@@ -261,23 +317,73 @@ class Client():
 			elif not sockdata: # Empty?
 				continue       # Try again.
 			else:
-				self.S.parse_server_str(sockdata)
-				if self.debug:
-					sys.stderr.write("\x1b[2J\x1b[H") # Clear for steady output.
-					print(self.S)
+				self.S.parse_server_bytes(sockdata)
+				self.steps+= 1
+				if timers:
+					self.received_at= time.perf_counter()
+					timers.record('receive', received - started)
+					timers.record('parse', self.received_at - received)
+					if self.sent_at: timers.record('roundtrip', received - self.sent_at)
+					timers.tick()
+				if self.debug: # Drawn from another thread, see TelemetryRenderer.
+					self.telemetry_renderer().state= sockdata
 				break # Can now return from this function.
 
+	def drain_socket(self, sockdata):
+		'''Reads whatever else is already queued on the socket, without
+		waiting, and returns the newest datagram. Server messages like
+		***shutdown*** are returned right away so they are not lost.'''
+		skipped= 0
+		timeout= self.so.gettimeout()
+		self.so.settimeout(0) # Non-blocking while draining.
+		try:
+			while not sockdata.startswith(b'***'):
+				try:
+					newer,addr= self.so.recvfrom(data_size)
+				except socket.error: # Nothing more is queued.
+					break
+				if self.capture: self.capture.record(session_log.RECEIVED, newer)
+				sockdata= newer
+				skipped+= 1
+		finally:
+			self.so.settimeout(timeout)
+		if skipped:
+			self.skipped+= skipped
+			self.stale_steps+= 1
+			self.max_skipped= max(self.max_skipped, skipped)
+		return sockdata
+
+	def drop_stats(self):
+		'''How stale the states acted on were this race.'''
+		return {'steps': self.steps,
+				'skipped': self.skipped,
+				'stale_steps': self.stale_steps,
+				'max_skipped': self.max_skipped,
+				'drop_rate': self.skipped / float(max(1, self.steps + self.skipped))}
+
+	def reset_drop_stats(self):
+		self.steps= self.skipped= self.stale_steps= self.max_skipped= 0
+
 	def respond_to_server(self):
 		if not self.so: return
+		timers= self.timers
+		if timers:
+			sending= time.perf_counter()
+			if self.received_at: timers.record('drive', sending - self.received_at)
 		try:
-			message = repr(self.R)
-			self.so.sendto(message.encode(), (self.host, self.port))
+			if self.encoder:
+				message = self.encoder.encode_action(self.R)
+			else:
+				message = repr(self.R).encode()
+			self.so.sendto(message, (self.host, self.port))
+			if self.capture: self.capture.record(session_log.SENT, message)
 		except socket.error as emsg:
 			print("Error sending to server: %s Message %s" % (emsg[1],str(emsg[0])))
 			sys.exit(-1)
-		if self.debug: print(self.R.fancyout())
-		# Or use this for plain output:
-		#if self.debug: print self.R
+		if timers:
+			self.sent_at= time.perf_counter()
+			timers.record('send', self.sent_at - sending)
+		if self.debug: self.telemetry_renderer().action= message
 
 	def shutdown(self):
 		if not self.so: return
@@ -285,13 +391,80 @@ class Client():
 			   % (self.maxSteps,self.port)))
 		self.so.close()
 		self.so = None
+		if self.capture: self.capture.close()
+		if self.telemetry: self.telemetry.stop()
 		#sys.exit() # No need for this really.
 
+	def restart(self):
+		'''Restarts the race (meta) and identifies again over the same
+		socket. Much quicker than shutting down and building a new Client,
+		which is what a restart used to take.'''
+		if self.so:
+			self.R.d['meta']= True
+			self.respond_to_server()
+		# Nothing of the last race's actions carries over, whichever way.
+		self.R= DriverAction()
+		self.reset_drop_stats()
+		if not self.so: return self.setup_connection()
+		# Same track sensor angles as setup_connection.
+		a= "-45 -19 -12 -7 -4 -2.5 -1.7 -1 -.5 0 .5 1 1.7 2.5 4 7 12 19 45"
+		initmsg= ('%s(init %s)' % (self.sid,a)).encode()
+		while True:
+			self.so.sendto(initmsg, (self.host, self.port))
+			if self.capture: self.capture.record(session_log.SENT, initmsg)
+			try:
+				while True: # Skip whatever the old race still had queued.
+					sockdata,addr= self.so.recvfrom(data_size)
+					if self.capture: self.capture.record(session_log.RECEIVED, sockdata)
+					if b'***identified***' in sockdata:
+						print("Client connected on %d.............." % self.port)
+						return
+			except socket.error as emsg:
+				print("Waiting for server on %d............" % self.port)
+
+	def telemetry_renderer(self):
+		if self.telemetry is None:
+			self.telemetry= TelemetryRenderer(self.telemetry_rate).start()
+		return self.telemetry
+
+class ReplayClient(Client):
+	'''Plays a session captured with Client(capture=...) back through the
+	usual get_servers_input, without a server: at full speed, or at the
+	original timing with realtime=True. Replies go nowhere.'''
+	def __init__(self,path,realtime=False,vision=False,parser='dict',timers=None,drain=False):
+		self.replay= session_log.ReplaySocket(path, realtime)
+		Client.__init__(self,vision=vision,parser=parser,timers=timers,drain=drain)
+
+	def parse_the_command_line(self):
+		pass
+
+	def setup_connection(self):
+		self.so= self.replay
+
 class ServerState():
 	'''What the server is reporting right now.'''
-	def __init__(self):
+	skip_img= False # Cut the img sensor out unparsed, for sensor-only agents.
+
+	def __init__(self, record=False):
 		self.servstr= str()
 		self.d= dict()
+		self.record= None
+		if record:
+			# One slot per known sensor, filled in place every step. The
+			# entries of "d" are views into it, so S.d['speedX'] and
+			# S.d['track'] keep working (as 0-d and 1-d float arrays).
+			# Copy a value if you need to keep it past the next step.
+			self.record= np.zeros((), dtype=server_state_dtype)
+			self.flat= self.record.reshape(1).view(np.float32)
+			self.offsets= dict() # Where each sensor lives in self.flat.
+			for k in server_state_dtype.names:
+				self.d[k]= self.record[k]
+				start= server_state_dtype.fields[k][1] // self.flat.itemsize
+				self.offsets[k.encode()]= (start, start + self.d[k].size)
+			self.plan= None
+			self.plan_index= None
+		# The vision sensor is decoded on its own, into this buffer.
+		self.img= np.zeros((64, 64, 3), dtype=np.uint8)
 
 	def parse_server_str(self, server_string):
 		'''Parse the server string.'''
@@ -301,6 +474,63 @@ class ServerState():
 			w= i.split(' ')
 			self.d[w[0]]= destringify(w[1:])
 
+	def parse_server_bytes(self, server_bytes):
+		'''Parse the datagram as received. Without a record this is
+		just parse_server_str on the decoded string. The img sensor, if
+		there is one, is cut out first and goes to parse_image.'''
+		start= server_bytes.find(b'(img ')
+		if start >= 0:
+			stop= server_bytes.find(b')', start)
+			if not self.skip_img: self.parse_image(server_bytes[start+5:stop])
+			server_bytes= server_bytes[:start] + server_bytes[stop+1:]
+		if self.record is None:
+			self.parse_server_str(server_bytes.decode('utf-8'))
+			return
+		sslisted= server_bytes.strip()[:-1].strip().lstrip(b'(').rstrip(b')').split(b')(')
+		parts= [i.partition(b' ') for i in sslisted]
+		names= [w[0] for w in parts]
+		if names != self.plan:
+			self.make_plan(names)
+		if self.plan_index is not None:
+			# Usual case: convert every value in one go and scatter them.
+			values= np.fromstring(b' '.join([w[2] for w in parts]), dtype=np.float32, sep=' ')
+			if values.size == self.plan_index.size:
+				self.flat[self.plan_index]= values
+				return
+		for k,_,v in parts: # Unknown sensors or odd sizes, one at a time.
+			if k in self.offsets:
+				start,stop= self.offsets[k]
+				values= np.fromstring(v, dtype=np.float32, sep=' ')
+				if values.size == stop - start or values.size == 1:
+					self.flat[start:stop]= values # Broadcast, e.g. (focus -1).
+				else: # Whatever fits, NaN for the rest. S.d[k] stays the view.
+					n= min(values.size, stop - start)
+					self.flat[start:stop]= np.nan
+					self.flat[start:start+n]= values[:n]
+				continue
+			self.d[k.decode()]= destringify(v.decode().split(' '))
+
+	def parse_image(self, img_bytes):
+		'''Decodes the img sensor (64x64 RGB as 12288 numbers) straight
+		from the datagram into self.img, which S.d['img'] points to. The
+		buffer is reused, copy it if you need to keep a frame.'''
+		pixels= np.fromstring(img_bytes, dtype=np.uint8, sep=' ')
+		if pixels.size != self.img.size: # Not plain integers?
+			pixels= np.fromstring(img_bytes, dtype=np.float32, sep=' ')
+		if pixels.size != self.img.size: # Some other resolution, leave it flat.
+			self.d['img']= pixels
+			return
+		self.img.reshape(-1)[:]= pixels
+		self.d['img']= self.img
+
+	def make_plan(self, names):
+		'''Works out where the values of a message with these sensors,
+		in this order, go in the record.'''
+		self.plan= names
+		self.plan_index= None
+		if all([k in self.offsets for k in names]):
+			self.plan_index= np.concatenate([np.arange(*self.offsets[k]) for k in names])
+
 	def __repr__(self):
 		# Comment the next line for raw output:
 		return self.fancyout()
@@ -345,7 +575,7 @@ class ServerState():
 
 		#for k in sorted(self.d): # Use this to get all sensors.
 		for k in sensors:
-			if type(self.d.get(k)) is list: # Handle list type data.
+			if type(self.d.get(k)) is list or np.ndim(self.d.get(k)): # Handle list type data.
 				if k == 'track': # Nice display for track sensors.
 					strout= str()
 				 #  for tsensor in self.d['track']:
@@ -376,6 +606,8 @@ class ServerState():
 					strlist= [str(i) for i in self.d[k]]
 					strout= ', '.join(strlist)
 			else: # Not a list type of value.
+				if k not in self.d and k not in ['skid', 'slip']:
+					continue # Not reported by this server.
 				if k == 'gear': # This is redundant now since it's part of RPM.
 					gs= '_._._._._._._._._'
 					p= int(self.d['gear']) * 2 + 2  # Position
@@ -441,6 +673,134 @@ class ServerState():
 			out+= "%s: %s\n" % (k,strout)
 		return out
 
+class LazySensors(dict):
+	'''The "d" of a LazyServerState. A sensor is converted from the raw
+	datagram the first time it is read within a step, and kept until the
+	next datagram comes in. Otherwise it behaves like the usual dict.'''
+	def __init__(self, state):
+		dict.__init__(self)
+		self.state= state
+		self.raw= bytes()
+
+	def reset(self, raw):
+		dict.clear(self)
+		self.raw= raw
+
+	def __missing__(self, k):
+		v= self.state.convert(k)
+		dict.__setitem__(self, k, v)
+		return v
+
+	def get(self, k, default=None):
+		try:
+			return self[k]
+		except KeyError:
+			return default
+
+	def __contains__(self, k):
+		return dict.__contains__(self, k) or self.state.find(k) is not None
+
+	def keys(self):
+		names= [k.decode() for k in re.findall(rb'\(([A-Za-z]+) ', self.raw)]
+		return names + [k for k in dict.keys(self) if k not in names]
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self.keys())
+
+	def items(self):
+		return [(k, self[k]) for k in self.keys()]
+
+	def values(self):
+		return [self[k] for k in self.keys()]
+
+	def copy(self):
+		return dict(self.items())
+
+class LazyServerState(ServerState):
+	'''A ServerState that only keeps the datagram when it comes in and
+	converts the sensors actually read (see LazySensors). Handy when
+	drive() only looks at a handful of them.'''
+	def __init__(self):
+		ServerState.__init__(self)
+		self.d= LazySensors(self)
+
+	def parse_server_str(self, server_string):
+		self.parse_server_bytes(server_string.encode())
+
+	def parse_server_bytes(self, server_bytes):
+		self.d.reset(server_bytes)
+
+	def find(self, k):
+		'''Where the values of sensor k are in the datagram, or None.'''
+		raw= self.d.raw
+		start= raw.find(b'(' + k.encode() + b' ')
+		if start < 0: return None
+		start+= len(k) + 2
+		return start, raw.find(b')', start)
+
+	def convert(self, k):
+		span= self.find(k)
+		if span is None: raise KeyError(k)
+		v= self.d.raw[span[0]:span[1]]
+		if k == 'img':
+			self.parse_image(v)
+			return dict.__getitem__(self.d, 'img')
+		w= v.split()
+		try:
+			if len(w) == 1: return float(w[0])
+			return [float(x) for x in w]
+		except ValueError:
+			return destringify(v.decode().split(' '))
+
+class TelemetryRenderer():
+	'''Draws the --debug telemetry (the fancyout of the server state and of
+	our reply) from a background thread, rate times a second. The control
+	loop only hands over the latest datagrams, which are immutable bytes,
+	and the renderer parses its own copies, so drawing the bar graphs never
+	holds up a step and always shows one consistent snapshot.'''
+	def __init__(self, rate=5., out=sys.stdout):
+		self.rate= rate
+		self.out= out
+		self.state= None # Latest datagram from the server.
+		self.action= None # Latest reply to it.
+		self.S= ServerState()
+		self.R= DriverAction()
+		self.running= False
+		self.thread= None
+
+	def start(self):
+		self.running= True
+		self.thread= threading.Thread(target=self.run)
+		self.thread.daemon= True
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.running= False
+
+	def run(self):
+		drawn= (None, None)
+		while self.running:
+			time.sleep(1. / self.rate)
+			snapshot= (self.state, self.action)
+			if snapshot[0] is None or (snapshot[0] is drawn[0] and snapshot[1] is drawn[1]):
+				continue
+			self.out.write(self.render(*snapshot))
+			self.out.flush()
+			drawn= snapshot
+
+	def render(self, state, action=None):
+		out= "\x1b[2J\x1b[H" # Clear for steady output.
+		self.S.parse_server_bytes(state)
+		out+= self.S.fancyout()
+		if action:
+			self.R.d.update(parse_driver_action(action))
+			out+= self.R.fancyout()
+		return out
+
 class DriverAction():
 	'''What the driver is intending to do (i.e. send to the server).
 	Composes something like this for the server:
@@ -509,7 +869,94 @@ class DriverAction():
 			out+= "%s: %s\n" % (k,strout)
 		return out
 
+# Columns of the compact action arrays ActionEncoder works on.
+action_columns= ['accel', 'brake', 'clutch', 'gear', 'steer', 'meta']
+
+class ActionEncoder():
+	'''Composes the same bytes as repr(DriverAction).encode() from a
+	prebuilt template. encode_batch() takes a compact float array, one
+	row per car with the columns in action_columns, and applies the
+	limits of DriverAction.clip_to_limits to all of it with numpy.'''
+	lo= np.array([0, 0, 0, -1, -1, 0], dtype=np.float64)
+	hi= np.array([1, 1, 1, 6, 1, 1], dtype=np.float64)
+
+	def __init__(self, focus=[-90,-45,0,45,90]):
+		self.set_focus(focus)
+
+	def set_focus(self, focus):
+		self.focus= focus
+		if type(focus) is list:
+			f= ' '.join([str(x) for x in focus])
+		else:
+			f= '%.3f' % focus
+		self.template= ('(accel %.3f)(brake %.3f)(clutch %.3f)(gear %.3f)(steer %.3f)(focus '
+						+ f + ')(meta %.3f)').encode()
+
+	def clip(self, actions):
+		'''clip_to_limits for a whole (N, 6) array, in place.'''
+		gear= actions[:,3]
+		gear[(gear != np.rint(gear)) | (gear < -1) | (gear > 6)]= 0
+		meta= actions[:,5]
+		meta[(meta != 0) & (meta != 1)]= 0
+		np.clip(actions, self.lo, self.hi, out=actions)
+		return actions
+
+	def encode_batch(self, actions):
+		'''One reply per row of an (N, 6) action array.'''
+		self.clip(actions)
+		template= self.template
+		return [template % tuple(row) for row in actions.tolist()]
+
+	def encode(self, action):
+		'''The reply for a single (6,) action row.'''
+		return self.encode_batch(np.array(action, dtype=np.float64).reshape(1, 6))[0]
+
+	def encode_action(self, R):
+		'''The reply for a DriverAction. For a single car numpy costs more
+		than it saves, so this clips with R.clip_to_limits() (which also
+		keeps R.d within limits, as repr does) and only uses the template.'''
+		R.clip_to_limits()
+		d= R.d
+		if d['focus'] != self.focus:
+			self.set_focus(d['focus'])
+		return self.template % (d['accel'], d['brake'], d['clutch'], d['gear'], d['steer'], d['meta'])
+
 # == Misc Utility Functions
+def parse_driver_action(message):
+	'''Reads a reply like (accel 1)(brake 0)...(meta 0) back into a dict.'''
+	d= dict()
+	for i in message.decode().strip().lstrip('(').rstrip(')').split(')('):
+		w= i.split(' ')
+		d[w[0]]= destringify(w[1:])
+	return d
+
+def image_to_rgb(img, shape=(-1, 3)):
+	'''The img sensor as uint8 RGB pixels, one row per pixel by default or
+	shape=(64, 64, 3). Only a view when img is already the uint8 buffer
+	ServerState decodes into.'''
+	return np.asarray(img, dtype=np.uint8).reshape(shape)
+
+def make_server_state(parser='dict'):
+	'''The ServerState behind a client's parser option: 'dict' is the
+	classic S.d of floats and float lists, 'record' fills a preallocated
+	numpy record (see sensor_layout) and 'lazy' converts sensors on first
+	access (see LazyServerState).'''
+	if parser == 'lazy': return LazyServerState()
+	return ServerState(record=(parser == 'record'))
+
+def stringify(v):
+	'''The opposite of destringify, formats a value or a list of values
+	the way the server writes them. Strings are taken as formatted.'''
+	if type(v) is str: return v
+	if type(v) is list or type(v) is tuple or type(v) is np.ndarray:
+		return ' '.join([stringify(x) for x in v])
+	return '%g' % v
+
+def compose_server_str(d):
+	'''Composes a server string like (angle 0.1)(gear 1)...(track 1 2 3)
+	from a dictionary of sensor values. Handy for tests and benchmarks.'''
+	return ''.join(['(%s %s)' % (k, stringify(d[k])) for k in d]) + '\x00'
+
 def destringify(s):
 	'''makes a string into a value or a list of strings into a list of
 	values (if possible)'''
@@ -0,0 +1,229 @@
+"""Low-overhead latency histograms for the control loop.
+
+A StepTimers is handed to snakeoil3_gym.Client (and Environment) as
+timers=... and collects, for every step:
+
+	receive      waiting in recvfrom for the server's datagram
+	parse        ServerState parsing
+	observation  Environment.make_observaton
+	drive        everything between receiving and replying (policy, drive())
+	policy       Environment only: the agent's time between two steps
+	send         encoding DriverAction and sending it
+	roundtrip    from our reply to the server's next datagram
+
+Recording a value is a log and a list increment. timers.summary() gives
+count/mean/p50/p99/max per phase in milliseconds, and with interval set
+the same table is printed every interval seconds.
+
+EpisodeProfiler, Environment(profile=...), totals the phases of
+Environment.step and reset per episode instead and saves them as CSV
+or JSON.
+
+RateMeter, Environment.rate, measures the simulation speed actually
+achieved: server steps and simulated seconds per wall-clock second.
+"""
+import csv
+import json
+import math
+import sys
+import time
+
+
+class LatencyHistogram:
+    """Log-spaced histogram of durations from 1us to 100s."""
+
+    bins_per_decade = 20
+    low = 1e-6
+    decades = 8
+
+    def __init__(self):
+        self.counts = [0] * (self.bins_per_decade * self.decades + 2)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if seconds <= self.low:
+            self.counts[0] += 1
+            return
+        i = int(math.log10(seconds / self.low) * self.bins_per_decade) + 1
+        self.counts[min(i, len(self.counts) - 1)] += 1
+
+    def percentile(self, q):
+        """Upper edge of the bin holding the q-th percentile, in seconds."""
+        if not self.count:
+            return 0.
+        rank = q / 100. * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(self.low * 10 ** (i / float(self.bins_per_decade)), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.
+
+
+class StepTimers:
+    """One LatencyHistogram per phase, plus the periodic summary dump."""
+
+    phases = ['receive', 'parse', 'observation', 'drive', 'policy', 'send', 'roundtrip']
+
+    def __init__(self, interval=None, out=sys.stderr):
+        self.histograms = {}
+        self.interval = interval
+        self.out = out
+        self.steps = 0
+        self.last_dump = time.monotonic()
+
+    def record(self, phase, seconds):
+        if phase not in self.histograms:
+            self.histograms[phase] = LatencyHistogram()
+        self.histograms[phase].record(seconds)
+
+    def tick(self):
+        """Called once per step, dumps the summary when it is due."""
+        self.steps += 1
+        if self.interval and time.monotonic() - self.last_dump >= self.interval:
+            self.dump()
+
+    def summary(self):
+        """{phase: {'count', 'mean', 'p50', 'p99', 'max'}}, times in ms."""
+        out = {}
+        for phase, h in self.histograms.items():
+            out[phase] = {'count': h.count,
+                          'mean': h.mean() * 1e3,
+                          'p50': h.percentile(50) * 1e3,
+                          'p99': h.percentile(99) * 1e3,
+                          'max': h.max * 1e3}
+        return out
+
+    def format(self):
+        lines = ['%-12s %8s %9s %9s %9s %9s' % ('phase', 'count', 'mean ms', 'p50 ms', 'p99 ms', 'max ms')]
+        summary = self.summary()
+        order = [p for p in self.phases if p in summary] + sorted(set(summary) - set(self.phases))
+        for phase in order:
+            s = summary[phase]
+            lines.append('%-12s %8d %9.3f %9.3f %9.3f %9.3f' % (phase, s['count'], s['mean'], s['p50'], s['p99'], s['max']))
+        return '\n'.join(lines)
+
+    def dump(self):
+        self.last_dump = time.monotonic()
+        print(self.format(), file=self.out)
+        self.out.flush()
+
+    def reset(self):
+        self.histograms = {}
+        self.steps = 0
+
+
+class EpisodeProfiler:
+    """Where Environment.step and reset spend their time, per episode.
+
+    The Environment calls lap(phase, since) after each phase, which adds
+    the time since `since` to the phase and returns the current time for
+    the next one. Phases:
+
+        control      adjust_speed and adjust_gear
+        respond      respond_to_server
+        receive      get_servers_input, parsing included
+        reward       reward and termination checks
+        observation  make_observaton
+        reset        reset() up to the first datagram of the episode
+
+    Every finished episode is a row of totals in path, rewritten each time:
+    JSON if path ends with .json, CSV otherwise.
+    """
+
+    phases = ['control', 'respond', 'receive', 'reward', 'observation', 'reset']
+
+    def __init__(self, path):
+        self.path = path
+        self.episodes = []
+        self.start_episode()
+
+    def start_episode(self):
+        self.totals = dict.fromkeys(self.phases, 0.)
+        self.steps = 0
+        self.started = time.perf_counter()
+
+    def lap(self, phase, since):
+        now = time.perf_counter()
+        self.totals[phase] += now - since
+        return now
+
+    def step(self):
+        self.steps += 1
+
+    def end_episode(self, **extra):
+        """Adds the episode's row, extra columns included, and saves."""
+        if not self.steps:
+            return
+        row = {'episode': len(self.episodes) + 1,
+               'steps': self.steps,
+               'seconds': round(time.perf_counter() - self.started, 6)}
+        row.update(extra)
+        for phase in self.phases:
+            row[phase + '_ms'] = round(self.totals[phase] * 1e3, 3)
+            row[phase + '_ms_per_step'] = round(self.totals[phase] * 1e3 / self.steps, 4)
+        self.episodes.append(row)
+        self.write()
+        self.start_episode()
+
+    def write(self):
+        with open(self.path, 'w') as f:
+            if self.path.endswith('.json'):
+                json.dump(self.episodes, f, indent=1)
+                return
+            columns = []
+            for row in self.episodes:
+                columns += [k for k in row if k not in columns]
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(self.episodes)
+
+
+class RateMeter:
+    """Server steps, and simulated seconds, per wall-clock second.
+
+    reset(sim_time) at the start of an episode, tick(sim_time) for every
+    datagram, with sim_time the curLapTime sensor. The rates cover the
+    episode so far, total_steps and total_sim_seconds every episode. A
+    lap completed resets curLapTime, such a tick adds no simulated time.
+    """
+
+    def __init__(self):
+        self.total_steps = 0  # Over every episode.
+        self.total_sim_seconds = 0.
+        self.reset(0.)
+
+    def reset(self, sim_time):
+        self.started = time.perf_counter()
+        self.sim_time = sim_time
+        self.sim_seconds = 0.
+        self.steps = 0
+
+    def tick(self, sim_time):
+        if sim_time > self.sim_time:
+            self.sim_seconds += sim_time - self.sim_time
+            self.total_sim_seconds += sim_time - self.sim_time
+        self.sim_time = sim_time
+        self.steps += 1
+        self.total_steps += 1
+
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    def steps_per_second(self):
+        seconds = self.seconds()
+        return self.steps / seconds if seconds else 0.
+
+    def time_scale(self):
+        """Simulated seconds per wall-clock second, 1 is real time."""
+        seconds = self.seconds()
+        return self.sim_seconds / seconds if seconds else 0.
@@ -0,0 +1,169 @@
+"""N Environments stepped in parallel, one subprocess each.
+
+Every worker owns an Environment on its own port (first_port + i) and
+writes its observations straight into shared memory, so the parent gets
+stacked arrays without pickling a single image:
+
+    env = VectorEnvironment(4, first_port=3101, torcs=dict(xvfb=True))
+    observation = env.reset()          # observation.img: (4, 64, 64, 3) uint8
+    for _ in range(steps):             # observation.sensors: (4, 69) float32
+        actions = agent.act(observation)   # (4, action size)
+        observation, reward, done = env.step(actions)
+    env.close()
+
+A sub-environment whose episode ends is reset by its worker right away.
+Its row in the returned observation is then the first observation of the
+new episode. The arrays are overwritten by the next step, so copy them if
+you keep them (a replay buffer does anyway).
+
+With torcs=dict(xvfb=True) (any TorcsProcess arguments) every worker
+owns a TorcsProcess on its port, so relaunching one never touches the
+others. Without torcs the servers must already listen on the ports, e.g.
+python -m scripts.process_manager 4 --stand-in for a run without the
+simulator. launch=True (TorcsInstance, one TORCS per host, restarted
+with pkill) is only allowed for a single environment.
+
+With scheduler (a scripts.host_scheduler.HostScheduler) every worker and
+its TorcsProcess are pinned to their own cores, and env.report() gives
+the tick rate and CPU use of each instance.
+"""
+import collections as col
+import functools
+import multiprocessing as mp
+import numpy as np
+from observation import Observation
+
+VectorObservation = col.namedtuple('VectorObservation', ['img', 'sensors'])
+
+
+def make_environment(index, first_port=3101, torcs=None, scheduler=None, **kwargs):
+    from environment import Environment
+    if torcs is not None:
+        from scripts.process_manager import TorcsProcess
+        cores = scheduler.simulator_cores(index) if scheduler is not None else None
+        kwargs['process'] = TorcsProcess(first_port + index, cores=cores, **torcs)
+    else:
+        kwargs.setdefault('launch', False)
+    return Environment(port=first_port + index, **kwargs)
+
+
+def shared_array(buffer, dtype, shape):
+    return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+
+def worker(index, env_fn, pipe, buffers, scheduler=None):
+    """Runs the environment for row index of the shared arrays."""
+    from scripts.host_scheduler import InstanceMeter
+    if scheduler is not None:
+        scheduler.pin_client(index)  # Before any thread or simulator starts.
+    img, sensors, reward, done = [shared_array(*b) for b in buffers]
+    env = env_fn(index)
+    meter = InstanceMeter(env)
+
+    def put(ob):
+        if isinstance(ob, np.ndarray):  # Sensor-only, already the vector.
+            sensors[index] = ob
+            return
+        sensors[index] = ob.to_vector()
+        img[index] = ob.img.reshape(img.shape[1:])
+
+    try:
+        while True:
+            command, data = pipe.recv()
+            if command == 'step':
+                ob, r, d = env.step(data)
+                reward[index] = r
+                done[index] = d
+                if d:
+                    ob = env.reset()
+                put(ob)
+            elif command == 'reset':
+                put(env.reset())
+            elif command == 'report':
+                pipe.send(meter.report())
+                continue
+            elif command == 'close':
+                break
+            pipe.send(None)
+    finally:
+        env.close()
+        pipe.close()
+
+
+class VectorEnvironment:
+    """Steps n environments at once. env_fn(i) builds the i-th one, by
+    default an Environment on port first_port + i built with kwargs.
+    image_shape is the shape of one observation.img, which an
+    image_pipeline passed on to the Environments changes."""
+
+    def __init__(self, n, env_fn=None, first_port=3101, context=None, image_shape=None, scheduler=None,
+                 **kwargs):
+        self.n = n
+        if scheduler is not None:
+            scheduler.check(n)
+        if env_fn is None and n > 1 and kwargs.get('torcs') is None and kwargs.get('launch'):
+            raise ValueError('launch=True kills and starts every TORCS on the host, '
+                             'pass torcs=... to give each of the %d environments its own' % n)
+        if image_shape is None:
+            pipeline = kwargs.get('image_pipeline')
+            image_shape = pipeline.shape if pipeline else (64, 64, 3)
+            if kwargs.get('vision') is False:
+                image_shape = (0,)  # Sensor-only, observation.img stays empty.
+        if env_fn is None:
+            env_fn = functools.partial(make_environment, first_port=first_port, scheduler=scheduler, **kwargs)
+        ctx = mp.get_context(context)
+        layout = [(np.uint8, (n,) + tuple(image_shape)),
+                  (np.float32, (n, Observation.size)),
+                  (np.float32, (n,)),
+                  (np.bool_, (n,))]
+        buffers = [(ctx.RawArray('b', int(np.prod(shape)) * np.dtype(dtype).itemsize), dtype, shape)
+                   for dtype, shape in layout]
+        img, sensors, self.reward, self.done = [shared_array(*b) for b in buffers]
+        self.observation = VectorObservation(img=img, sensors=sensors)
+        self.pipes = []
+        self.processes = []
+        for i in range(n):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(target=worker, args=(i, env_fn, child, buffers, scheduler))
+            process.daemon = True
+            process.start()
+            child.close()
+            self.pipes.append(parent)
+            self.processes.append(process)
+
+    def wait(self):
+        for pipe in self.pipes:
+            pipe.recv()
+
+    def reset(self):
+        for pipe in self.pipes:
+            pipe.send(('reset', None))
+        self.wait()
+        return self.observation
+
+    def step(self, actions):
+        """actions has one row per environment. Returns the observation,
+        rewards and dones, each stacked over the environments."""
+        for pipe, u in zip(self.pipes, actions):
+            pipe.send(('step', u))
+        self.wait()
+        return self.observation, self.reward, self.done
+
+    def report(self):
+        """Per environment: port, cores, ticks_per_second, time_scale and
+        simulator_cpu/client_cpu in cores, all since it started (see
+        scripts.host_scheduler.InstanceMeter)."""
+        for pipe in self.pipes:
+            pipe.send(('report', None))
+        return [pipe.recv() for pipe in self.pipes]
+
+    def close(self):
+        for pipe in self.pipes:
+            try:
+                pipe.send(('close', None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self.processes:
+            process.join()
+        self.pipes = []
+        self.processes = []